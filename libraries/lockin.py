@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 03:20 2026
+
+Batched readout of the SR860 lockin.
+
+Reading lockin.X(), lockin.Y(), lockin.R() and lockin.P() one after the other takes four GPIB/VISA round trips and
+each value is from a slightly different time. SNAP? returns up to three values captured at the same instant, so
+X and Y are read in a single query and R and P are calculated from them (exactly what the lockin does internally).
+
+    >> snap = Snap(lockin)
+    >> X, Y, R, P = snap()
+
+BufferCapture records X and Y into the lockin's internal buffer at a fixed rate (its own clock or one sample per
+pulse of an MDAC trigger) while the gates are stepped, and downloads the samples in one go afterwards. align()
+averages the samples taken while each setpoint was held, so nothing is queried per point.
+
+    >> capture = BufferCapture(lockin, rate=1000, trigger=mdac.trigger0)
+    >> capture.start(duration=20)
+    >> ... step the gate, keeping the time.perf_counter() of every step
+    >> t, X, Y = capture.stop()
+    >> X = align(t, X, starts + settle, ends)
+
+@author: james
+"""
+
+import math
+import time
+import numpy as np
+from qcodes.instrument.parameter import MultiParameter
+from qcodes.instrument_drivers.stanford_research.SR860 import SR860
+
+
+QUANTITIES = ("X", "Y", "R", "P")
+BUFFER_KB = 4096  # size of the SR860 capture buffer
+
+
+def derive(X, Y) -> tuple:
+    """R and P (degrees, same as the lockin) from X and Y. Works on single values and arrays."""
+    return np.hypot(X, Y), np.degrees(np.arctan2(Y, X))
+
+
+class Snap(MultiParameter):
+    """X, Y, R and P of a lockin from a single SNAP? query."""
+
+    def __init__(self, lockin: SR860, name: str = "XYRP"):
+        super().__init__(
+            name,
+            names=QUANTITIES,
+            shapes=((), (), (), ()),
+            labels=("X", "Y", "R", "Phase"),
+            units=("V", "V", "V", "deg"),
+            instrument=None,
+            docstring="X, Y, R and P of the lockin captured at the same time",
+        )
+        self.lockin = lockin
+
+    def get_raw(self) -> tuple:
+        X, Y = self.lockin.get_values("X", "Y")
+        R, P = derive(X, Y)
+        return X, Y, float(R), float(P)
+
+
+def poll(lockin: SR860) -> tuple:
+    """The old way: four separate queries. Only for comparing against Snap."""
+    return lockin.X(), lockin.Y(), lockin.R(), lockin.P()
+
+
+def align(t: np.ndarray, values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Mean of the values sampled at times t in each window [starts[i], ends[i]). NaN if there are none."""
+    lo = np.searchsorted(t, starts, side="left")
+    hi = np.searchsorted(t, ends, side="left")
+    sums = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    counts = hi - lo
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, (sums[hi] - sums[lo]) / np.maximum(counts, 1), np.nan)
+
+
+class BufferCapture:
+    """Record X and Y in the lockin's capture buffer at a fixed rate (see the module docstring)."""
+
+    def __init__(self, lockin: SR860, rate: float = None, trigger=None, settle: float = 0.0):
+        """
+        rate= samples per second. With the lockin's clock it is rounded to the nearest rate the lockin supports
+              (max rate / 2^n) and defaults to the maximum rate. With a trigger it is the trigger frequency
+        trigger= MDAC Trigger to clock the samples with (one sample per pulse). The lockin's TRIG IN must be
+                 connected to it. None uses the lockin's own clock
+        settle= seconds after each gate step that are ignored when aligning (let the lockin filter catch up)
+        """
+        self.lockin = lockin
+        self.buffer = lockin.buffer
+        self.trigger = trigger
+        self.settle = settle
+        if trigger is not None:
+            if rate is None:
+                raise ValueError("ERROR: Give the rate of the trigger")
+            self.rate = rate
+        else:
+            rate_max = self.buffer.capture_rate_max()
+            n = 0 if rate is None else min(20, max(0, round(math.log2(rate_max / rate))))
+            self.rate = rate_max / 2 ** n
+        self.t0 = None
+
+    def start(self, duration: float):
+        """Start recording. duration= seconds that will be recorded (to size the buffer)"""
+        self.buffer.capture_config("X,Y")
+        if self.trigger is None:
+            self.buffer.capture_rate(self.rate)
+        kb = math.ceil(self.rate * duration * 2 * 4 / 1024) + 1  # two float32 per sample
+        kb += kb % 2  # the length must be even
+        if kb > BUFFER_KB:
+            raise ValueError(f"ERROR: {duration:.1f} s at {self.rate:.1f} Sa/s doesn't fit in the lockin buffer "
+                             f"({kb} kB > {BUFFER_KB} kB). Use a lower rate")
+        self.buffer.capture_length_in_kb(kb)
+        self.buffer.start_capture("ONE", "SAMP" if self.trigger is not None else "IMM")
+        if self.trigger is not None:  # the first pulse is the first sample
+            self.trigger.start(self.rate)
+        self.t0 = time.perf_counter()
+
+    def stop(self) -> tuple:
+        """Stop recording and download the samples. Returns (t, X, Y) with t in time.perf_counter() seconds."""
+        if self.trigger is not None:
+            self.trigger.stop()
+        self.buffer.stop_capture()
+        count = self.buffer.count_capture_bytes() // 8
+        if count == 0:
+            return np.zeros(0), np.zeros(0), np.zeros(0)
+        data = self.buffer.get_capture_data(count)
+        t = self.t0 + np.arange(count) / self.rate
+        return t, np.asarray(data["X"], dtype=np.float64), np.asarray(data["Y"], dtype=np.float64)
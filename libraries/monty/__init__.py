@@ -10,8 +10,10 @@ Monty library for saving and loading data quickly
 from .monty import Monty
 from .monty11 import Monty as Monty11  # v1.1
 from .raw import loadraw
+from .catalogue import Catalogue
+from .bulk import loadmany
 
 __version__ = 1.3
 
-__all__ = [Monty, Monty11, loadraw]
+__all__ = [Monty, Monty11, loadraw, Catalogue, loadmany]
 
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:30 2026
+
+Benchmark the Monty codecs on data that looks like our sweeps.
+
+Run from libraries/ with
+    python -m monty.benchmark [codec ...]
+
+Prints the write/read throughput (MB/s of uncompressed data) and the compression ratio for each dataset and codec.
+
+@author: james
+"""
+
+import os
+import pickle
+import sys
+import tempfile
+import time
+import numpy as np
+
+from . import container, compression
+
+
+CODECS = ["lzma", "lzma:1", "lzma:1+shuffle", "zlib:1", "zlib:6+shuffle", "bz2:9", "none", "none+shuffle"]
+
+
+def _coulomb(x: np.ndarray, rng) -> np.ndarray:
+    """Coulomb peaks on top of lockin noise (in A)."""
+    peaks = sum(np.exp(-((x - c) / 0.005)**2) for c in np.linspace(x.min(), x.max(), 7))
+    return 1e-10 * peaks + 1e-12 * rng.standard_normal(x.shape)
+
+
+def sweep_data(shape: tuple, rng) -> dict:
+    """X, Y, R, P as returned by swiper."""
+    x = np.linspace(0, 1, shape[-1])
+    if len(shape) == 2:
+        x = x + np.linspace(0, 0.3, shape[0])[:, np.newaxis]
+    R = _coulomb(x, rng)
+    P = 180 * rng.random(shape) - 90
+    return {"X": R * np.cos(np.radians(P)), "Y": R * np.sin(np.radians(P)), "R": R, "P": P}
+
+
+def datasets(seed: int = 0) -> dict:
+    """Representative datasets to benchmark."""
+    rng = np.random.default_rng(seed)
+    shfqc = np.exp(1j * np.linspace(0, 6, 1000)) * (1e-3 + 1e-5 * rng.standard_normal((100, 1000)))
+    return {
+        "1D 400-pt": sweep_data((400,), rng),
+        "2D 200x200": sweep_data((200, 200), rng),
+        "2D 1001x1001": sweep_data((1001, 1001), rng),
+        "SHFQC complex 100x1000": {"result": shfqc.astype(np.complex128)},
+    }
+
+
+def bench_container(data: dict, codec: str, path: str):
+    """Returns (write seconds, read seconds, file size)."""
+    t = time.perf_counter()
+    container.save(path, data, {"runname": "benchmark"}, codec)
+    written = time.perf_counter() - t
+    t = time.perf_counter()
+    loaded = container.load(path, lazy=False)["data"]
+    read = time.perf_counter() - t
+    for key in data:
+        if not np.array_equal(loaded[key], data[key]):
+            raise ValueError(f"ERROR: Round trip of '{key}' failed with codec {codec}")
+    return written, read, os.path.getsize(path)
+
+
+def bench_pickle(data: dict, path: str):
+    """The original LZMA pickle for reference."""
+    t = time.perf_counter()
+    with compression.open_pickle(path, "w", "lzma") as fz:
+        pickle.dump({"data": data}, fz, 4)
+    written = time.perf_counter() - t
+    t = time.perf_counter()
+    with compression.open_pickle(path) as fz:
+        pickle.load(fz)
+    read = time.perf_counter() - t
+    return written, read, os.path.getsize(path)
+
+
+def main(codecs: list):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "benchmark")
+        for name, data in datasets().items():
+            nbytes = sum(v.nbytes for v in data.values())
+            print(f"\n{name} ({nbytes / 1e6:.2f} MB)")
+            print(f"{'codec':>22} {'write MB/s':>11} {'read MB/s':>10} {'ratio':>7}")
+            results = [("pickle lzma (legacy)", *bench_pickle(data, path))]
+            results += [(codec, *bench_container(data, codec, path)) for codec in codecs]
+            for codec, written, read, size in results:
+                print(f"{codec:>22} {nbytes / 1e6 / written:>11.1f} {nbytes / 1e6 / read:>10.1f} {nbytes / size:>7.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] if len(sys.argv) > 1 else CODECS)
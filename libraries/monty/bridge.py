@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 03:19 2026
+
+Bridge between Monty runs and QCoDeS datasets (the SQLite database written by qcodes_measurements and doNd).
+
+    >> from monty import Monty, bridge
+    >> bridge.to_qcodes(Monty("dc.power_recovery"), db="experiments.db")  # every run -> {runname: run_id}
+    >> bridge.from_qcodes([12, 13], Monty("qcodes.tuning"), db="experiments.db")  # -> {run_id: runname}
+
+Monty -> QCoDeS: every run becomes a dataset in the experiment named after the Monty identifier. Arrays are
+dependent parameters on a grid of setpoints; pass setpoints={name: values} (one per array axis, in order) or they
+are taken from run parameters written as "range from 3.62v -> 3.75v, over 201 pts" (in the order of the
+parameters), otherwise the array index is used. Each dataset is written with a single add_result (one batched
+insert) and the run parameters and non-array data are stored in its metadata as JSON.
+
+QCoDeS -> Monty: every dependent parameter becomes an array, reshaped onto its setpoint grid when the data is a
+complete grid, and every setpoint is saved as the list of its values. The dataset metadata (and the exported Monty
+parameters of datasets that came from Monty) become the run parameters, and the setpoints of every array are
+recorded in the qcodes_setpoints parameter so imported runs are exported with the same setpoints.
+
+Values that can't be written as JSON are saved as their repr.
+
+@author: james
+"""
+
+import json
+import os
+import re
+import numpy as np
+
+from qcodes.dataset.measurements import Measurement
+from qcodes.dataset.data_set import load_by_id
+from qcodes.dataset.experiment_container import load_or_create_experiment
+from qcodes.dataset.sqlite.database import initialise_or_create_database_at
+
+
+# metadata tags of exported runs
+PARAMETERS_TAG = "monty_parameters"
+DATA_TAG = "monty_data"
+SOURCE_TAG = "monty_source"
+SETPOINTS_TAG = "qcodes_setpoints"  # run parameter of imported runs: {array: [setpoint names]}
+
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_RANGE = re.compile(rf"range from\s*({_NUMBER})\s*v?\s*->\s*({_NUMBER})\s*v?,?\s*over\s*(\d+)\s*pts", re.IGNORECASE)
+
+
+def _json(value) -> str:
+    return json.dumps(value, default=repr)
+
+
+def _database(db: str):
+    """Use the database at db (created if needed). None keeps the database qcodes is configured with."""
+    if db is not None:
+        initialise_or_create_database_at(os.path.expanduser(db))
+
+
+def parse_setpoints(parameters: dict) -> dict:
+    """Sweep axes in run parameters written like "range from 3.62v -> 3.75v, over 201 pts". {name: values}"""
+    axes = {}
+    if not isinstance(parameters, dict):
+        return axes
+    for name, value in parameters.items():
+        match = _RANGE.search(str(value))
+        if match:
+            axes[str(name)] = np.linspace(float(match[1]), float(match[2]), int(match[3]))
+    return axes
+
+
+def _axes(key: str, shape: tuple, setpoints: dict) -> list:
+    """(name, values) of the setpoint of every axis of an array."""
+    if tuple(len(values) for values in setpoints.values()) == shape:
+        return [(name, np.asarray(values)) for name, values in setpoints.items()]
+    if len(shape) == 1:  # e.g. a line cut of a 2D run
+        for name, values in setpoints.items():
+            if len(values) == shape[0]:
+                return [(name, np.asarray(values))]
+    return [(f"{key}_index{axis}", np.arange(n)) for axis, n in enumerate(shape)]
+
+
+def _recorded(arr: np.ndarray, names: list, numeric: dict) -> tuple:
+    """
+    (name, values) of the setpoints recorded for an imported array and if they are given per point (not a grid).
+    ([], False) if there are none.
+    """
+    if not names or not all(name in numeric for name in names):
+        return [], False
+    axes = [(name, numeric[name].reshape(-1)) for name in names]
+    if tuple(len(values) for _, values in axes) == arr.shape:
+        return axes, False
+    if arr.ndim == 1 and all(len(values) == arr.size for _, values in axes):
+        return axes, True
+    return [], False
+
+
+def export_run(experiment, runname: str, run: dict, data: dict, setpoints: dict = None) -> int:
+    """
+    Write a single run to a new dataset of a QCoDeS experiment. Returns the run id.
+
+    run= the run as saved in experiment.yaml (parameters, time_start, ...)
+    setpoints= {name: values} of the axes of the arrays. Defaults to the ranges in the run parameters. Arrays of
+               data that are the same as a setpoint are only written as the setpoint
+    """
+    parameters = run.get("parameters", {})
+    setpoints = parse_setpoints(parameters) if setpoints is None else setpoints
+    recorded = parameters.get(SETPOINTS_TAG, {}) if isinstance(parameters, dict) else {}
+    numeric = {str(key): np.asarray(value) for key, value in data.items()
+               if hasattr(value, "shape") and np.ndim(value) > 0 and np.asarray(value).dtype.kind in "biufc"}
+    used = {name for names in recorded.values() for name in names if name in numeric}
+    used.update(key for key, values in setpoints.items() if key in numeric and numeric[key].shape == np.shape(values)
+                and np.allclose(numeric[key], values))
+    arrays = {key: arr for key, arr in numeric.items() if key not in used}
+    others = {str(key): value for key, value in data.items() if str(key) not in numeric}
+
+    meas = Measurement(exp=experiment, name=runname)
+    meas.write_period = float("inf")  # everything is written in one go when the run ends
+    registered = set()
+    results = []
+    for key, arr in arrays.items():
+        axes, rows = _recorded(arr, recorded.get(key), numeric)
+        axes = axes or _axes(key, arr.shape, setpoints)
+        for name, values in axes:
+            if name not in registered:
+                meas.register_custom_parameter(name, paramtype="numeric")
+                registered.add(name)
+        if key in registered:
+            raise ValueError(f"ERROR: '{key}' is both a setpoint and an array of run '{runname}'")
+        meas.register_custom_parameter(key, setpoints=[name for name, _ in axes],
+                                       paramtype="complex" if arr.dtype.kind == "c" else "numeric")
+        registered.add(key)
+        if rows:  # one setpoint value per point
+            results.append(axes + [(key, arr)])
+            continue
+        grid = np.meshgrid(*[values for _, values in axes], indexing="ij")
+        results.append([(name, g.reshape(-1)) for (name, _), g in zip(axes, grid)] + [(key, arr.reshape(-1))])
+
+    with meas.run() as datasaver:
+        dataset = datasaver.dataset
+        dataset.add_metadata(PARAMETERS_TAG, _json(parameters))
+        dataset.add_metadata(SOURCE_TAG, _json({key: run.get(key) for key in ("runid", "time_start", "time_end",
+                                                                              "datafiles", "figures")}))
+        if others:
+            dataset.add_metadata(DATA_TAG, _json(others))
+        for result in results:
+            datasaver.add_result(*result)  # numeric arrays are unrolled into rows and inserted together
+    return dataset.run_id
+
+
+def to_qcodes(monty, runnames: list = None, setpoints: dict = None, db: str = None, sample_name: str = "monty",
+              workers: int = None, progress: bool = True) -> dict:
+    """
+    Export runs of a Monty experiment to QCoDeS datasets. Runs are loaded in parallel (see Monty.loadruns).
+
+    runnames= runs to export. Defaults to every run with saved data
+    setpoints= {name: values} used for every run (see export_run)
+    db= QCoDeS database file. Defaults to the one qcodes is configured with
+    sample_name= sample name of the QCoDeS experiment (named after the Monty identifier)
+
+    Returns {runname: run_id}.
+    """
+    _database(db)
+    experiment = load_or_create_experiment(monty.identifier, sample_name)
+    if runnames is None:
+        runnames = [run for run in monty.run_map if run in monty.runs and monty.runs[run].get("datafiles")]
+    run_ids = {}
+    for runname, data in monty.loadruns(runnames, workers=workers, progress=progress):
+        run_ids[runname] = export_run(experiment, runname, monty.runs[runname], data, setpoints)
+    return run_ids
+
+
+def _grid(values: list):
+    """Unique values of each setpoint and the shape of the grid if the rows are a complete grid in C order."""
+    axes = [np.unique(v, return_index=True) for v in values]
+    axes = [u[np.argsort(first)] for u, first in axes]  # in the order they were measured
+    shape = tuple(len(u) for u in axes)
+    n = len(values[0]) if values else 0
+    if n == 0 or int(np.prod(shape)) != n:
+        return axes, None
+    grid = np.meshgrid(*axes, indexing="ij")
+    if all(np.array_equal(g.reshape(-1), v) for g, v in zip(grid, values)):
+        return axes, shape
+    return axes, None
+
+
+def import_dataset(run_id: int) -> tuple:
+    """Read a QCoDeS dataset as (name, parameters, data) ready to be saved as a Monty run."""
+    dataset = load_by_id(run_id)
+    metadata = dict(dataset.metadata)
+    parameters = {}
+    if PARAMETERS_TAG in metadata:
+        exported = json.loads(metadata.pop(PARAMETERS_TAG))
+        parameters.update(exported if isinstance(exported, dict) else {"parameters": exported})
+    parameters.pop(SETPOINTS_TAG, None)  # recorded again below
+    parameters.update({"qcodes_run_id": run_id, "qcodes_guid": dataset.guid, "qcodes_exp_name": dataset.exp_name,
+                       "qcodes_sample_name": dataset.sample_name})
+    data = json.loads(metadata.pop(DATA_TAG)) if DATA_TAG in metadata else {}
+    metadata.pop(SOURCE_TAG, None)
+    parameters.update(metadata)
+
+    for key, columns in dataset.get_parameter_data().items():
+        names = [name for name in columns if name != key]
+        axes, shape = _grid([np.asarray(columns[name]).reshape(-1) for name in names])
+        value = np.asarray(columns[key])
+        data[key] = value.reshape(shape) if shape is not None else value.reshape(-1)
+        for name, values in zip(names, axes if shape is not None else [columns[name] for name in names]):
+            data.setdefault(name, np.asarray(values).reshape(-1))
+        parameters.setdefault(SETPOINTS_TAG, {})[key] = names
+    return dataset.name, parameters, data
+
+
+def from_qcodes(run_ids: list, monty, runname: str = None, db: str = None) -> dict:
+    """
+    Import QCoDeS datasets as runs of a Monty experiment.
+
+    runname= name of the runs. Defaults to the dataset names
+    db= QCoDeS database file. Defaults to the one qcodes is configured with
+
+    Returns {run_id: runname}.
+    """
+    _database(db)
+    runnames = {}
+    for run_id in run_ids:
+        name, parameters, data = import_dataset(run_id)
+        monty.newrun(runname or name or f"qcodes_{run_id}", parameters)
+        monty.save(data)
+        runnames[run_id] = monty.runname
+    monty.flush()
+    return runnames
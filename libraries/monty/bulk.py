@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:00 2026
+
+Load many data files at once, decompressing them in parallel.
+
+    >> for path, data in loadmany(paths):  # files are yielded as they finish, not in order
+    ..     analyse(data["data"])
+
+LZMA decompression is CPU bound so every file is loaded in its own worker process. Only a bounded number of
+files are in flight at a time so loading hundreds of runs doesn't hold them all in memory; results are handed
+over as soon as they are done and can be dropped once processed.
+
+@author: james
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .raw import loadfile
+
+
+def _load(path: str, keys: list) -> dict:
+    """Worker. Arrays are read fully so they can be sent back to the main process."""
+    return loadfile(path, lazy=False, keys=keys)
+
+
+def loadmany(paths: list, workers: int = None, maxpending: int = None, processes: bool = True, progress: bool = True,
+             keys: list = None):
+    """
+    Load files in parallel. Generator of (path, data) in the order the files finish loading.
+
+    paths= full paths of the files to load
+    workers= number of worker processes. Defaults to the number of CPUs
+    maxpending= maximum number of files loaded or loading but not yet yielded. Defaults to 2 * workers
+    processes= use processes (default). Threads avoid copying the results between processes and still run
+               the decompression in parallel, but are slower for the pickle files
+    progress= print the number of files loaded
+    keys= only load these keys of data
+    """
+    paths = list(paths)
+    workers = workers or os.cpu_count() or 1
+    maxpending = maxpending or 2 * workers
+    if maxpending < 1:
+        raise ValueError("ERROR: maxpending must be at least 1")
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+
+    with executor(min(workers, max(len(paths), 1))) as pool:
+        todo = iter(paths)
+        pending = {}
+        done = 0
+
+        def submit():
+            for path in todo:
+                pending[pool.submit(_load, path, keys)] = path
+                if len(pending) >= maxpending:
+                    return
+
+        try:
+            submit()
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = pending.pop(future)
+                    try:
+                        data = future.result()
+                    except Exception as err:
+                        raise OSError(f"ERROR: Could not load '{path}': {err!r}") from err
+                    done += 1
+                    if progress:
+                        print(f"\rLoaded {done}/{len(paths)} files", end="", file=sys.stderr)
+                    yield path, data
+                submit()
+        finally:
+            for future in pending:  # stopped early, don't load the rest
+                future.cancel()
+            if progress:
+                print("", file=sys.stderr)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:00 2026
+
+Read-through cache of loaded data files for analysis sessions.
+
+    >> from monty import cache
+    >> cache.enable()  # at the top of a plotting script
+    >> Monty("dc.power_recovery").loadrun("1D_SET_sweep.7")  # decompressed once, then served from the cache
+
+Files are cached by (path, modification time, size) so a file that is re-saved is read again. There are two levels:
+
+    memory  decoded values shared by every Monty object in the process (least recently used, bounded in bytes)
+    disk    decompressed arrays as .npy files (memory mapped on load) so running the same script again is fast.
+            Least recently used entries are removed once the directory is bigger than the limit
+
+Cached arrays are read only since they are shared. Copy them (np.array(x)) before modifying them.
+
+@author: james
+"""
+
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from . import container
+from .container import _select
+from .fileio import FileLock, LOCK_FNAME
+from .raw import loadfile
+
+
+ENABLED = False  # used by Monty and loadraw unless told otherwise
+MAXBYTES = 1 << 30  # memory
+DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "monty")
+DISK_MAXBYTES = 20 << 30  # disk. 0 disables the disk cache
+
+_memory = OrderedDict()  # (path, mtime, size[, level, stat], key) -> value
+_nbytes = 0
+_lock = threading.Lock()
+
+
+def enable(maxbytes: int = None, directory: str = None, disk_maxbytes: int = None):
+    """
+    Turn on the cache for every Monty object in this process.
+
+    maxbytes= size of the memory cache
+    directory= disk cache directory (defaults to ~/.cache/monty)
+    disk_maxbytes= size of the disk cache. 0 disables it
+    """
+    global ENABLED, MAXBYTES, DIRECTORY, DISK_MAXBYTES
+    ENABLED = True
+    MAXBYTES = MAXBYTES if maxbytes is None else maxbytes
+    DIRECTORY = DIRECTORY if directory is None else directory
+    DISK_MAXBYTES = DISK_MAXBYTES if disk_maxbytes is None else disk_maxbytes
+
+
+def disable():
+    """Turn off the cache and empty the memory cache."""
+    global ENABLED
+    ENABLED = False
+    clear()
+
+
+def clear(disk: bool = False):
+    """Empty the memory cache (and the disk cache)."""
+    global _nbytes
+    with _lock:
+        _memory.clear()
+        _nbytes = 0
+    if disk and os.path.isdir(DIRECTORY):
+        shutil.rmtree(DIRECTORY)
+
+
+def _readonly(value):
+    if isinstance(value, np.ndarray):
+        value = value.view()
+        value.flags.writeable = False
+    return value
+
+
+def _remember(item: tuple, value):
+    global _nbytes
+    nbytes = getattr(value, "nbytes", 0) if not isinstance(value, np.memmap) else 0  # memmaps are paged by the OS
+    if nbytes > MAXBYTES:
+        return
+    with _lock:
+        if item in _memory:
+            return
+        _memory[item] = value
+        _nbytes += nbytes
+        while _nbytes > MAXBYTES:
+            _, old = _memory.popitem(last=False)
+            _nbytes -= getattr(old, "nbytes", 0) if not isinstance(old, np.memmap) else 0
+
+
+def _recall(item: tuple):
+    with _lock:
+        if item not in _memory:
+            return None
+        _memory.move_to_end(item)
+        return _memory[item]
+
+
+def _entry(path: str, mtime: int, size: int, *level) -> str:
+    """Disk cache directory of a file (or of a decimation level of it)."""
+    name = hashlib.sha1("|".join(str(x) for x in (path, mtime, size) + level).encode()).hexdigest()
+    return os.path.join(DIRECTORY, name)
+
+
+def _readdisk(entry: str, keys: list):
+    """(meta, {key: value}) of the cached keys."""
+    try:
+        with open(os.path.join(entry, "index.pkl"), "rb") as f:
+            index = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None, {}
+    values = {}
+    for key in keys if keys is not None else index["keys"]:
+        if key not in index["keys"]:
+            continue
+        fname = os.path.join(entry, index["keys"][key])
+        try:
+            if fname.endswith(".npy"):
+                values[key] = np.load(fname, mmap_mode="r")
+            else:
+                with open(fname, "rb") as f:
+                    values[key] = pickle.load(f)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            continue
+    os.utime(entry)  # recently used
+    return index, values
+
+
+def _fname(key, value) -> str:
+    """Name of the cached file of a key (the same in every process so concurrent writers can't mix up keys)."""
+    name = hashlib.sha1(repr(key).encode()).hexdigest()
+    return f"{name}.npy" if isinstance(value, np.ndarray) and not value.dtype.hasobject else f"{name}.pkl"
+
+
+def _writedisk(entry: str, meta: dict, allkeys: list, values: dict):
+    """Add values to a file's disk cache entry. The cache is disposable so errors are ignored."""
+    try:
+        os.makedirs(entry, exist_ok=True)
+        written = {}
+        for key, value in values.items():
+            fname = _fname(key, value)
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=entry)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    if fname.endswith(".npy"):
+                        np.save(f, value, allow_pickle=False)
+                    else:
+                        pickle.dump(value, f, 5)
+                os.replace(tmp, os.path.join(entry, fname))
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            written[key] = fname
+        with FileLock(os.path.join(entry, LOCK_FNAME), timeout=10.0):  # merge with keys cached by others
+            try:
+                with open(os.path.join(entry, "index.pkl"), "rb") as f:
+                    index = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                index = {"meta": meta, "allkeys": allkeys, "keys": {}}
+            index["keys"].update(written)
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=entry)
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(index, f, 5)
+            os.replace(tmp, os.path.join(entry, "index.pkl"))
+    except (OSError, pickle.PicklingError, ValueError):
+        return
+    _evict()
+
+
+def _evict():
+    """Remove the least recently used entries until the disk cache fits."""
+    entries = []
+    total = 0
+    for name in os.listdir(DIRECTORY):
+        entry = os.path.join(DIRECTORY, name)
+        try:
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+        except OSError:
+            continue
+        total += size
+    for _, size, entry in sorted(entries):
+        if total <= DISK_MAXBYTES:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def load(path: str, keys: list = None, level: int = 0, stat: str = "mean") -> dict:
+    """
+    Load a data file through the cache. Same as raw.loadfile(path, lazy=False, keys, level, stat) but arrays are
+    read only.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    ident = (path, st.st_mtime_ns, st.st_size) + ((level, stat) if level > 0 else ())
+
+    index = _recall(ident + ("__index__",))  # {"meta": ..., "allkeys": [...]}
+    if index is not None:
+        values = {key: _recall(ident + (key,)) for key in _select(index["allkeys"], keys, path)}
+        if all(value is not None for value in values.values()):
+            return {**index["meta"], "data": values}
+
+    entry = _entry(*ident)
+    values = {}
+    if DISK_MAXBYTES:
+        disk, values = _readdisk(entry, keys)
+        if disk is not None:
+            index = {"meta": disk["meta"], "allkeys": disk["allkeys"]}
+    if index is not None:
+        missing = [key for key in _select(index["allkeys"], keys, path) if key not in values]
+    else:  # only containers can read some of the keys without reading the rest
+        missing = keys if container.iscontainer(path) else None
+
+    if index is None or missing:
+        saved = loadfile(path, lazy=False, keys=missing, level=level, stat=stat)
+        loaded = saved.pop("data")
+        if index is None:
+            allkeys = list(loaded) if missing is None else list(container.readheader(path)["entries"])
+            index = {"meta": saved, "allkeys": allkeys}
+        if DISK_MAXBYTES:
+            _writedisk(entry, index["meta"], index["allkeys"], loaded)
+        values.update(loaded)
+
+    _remember(ident + ("__index__",), index)
+    data = {}
+    for key in _select(index["allkeys"], keys, path):
+        data[key] = _readonly(values[key])
+        _remember(ident + (key,), data[key])
+    return {**index["meta"], "data": data}
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:00 2026
+
+SQLite catalogue of every experiment and run in DATA_DIR.
+
+Monty keeps the catalogue up to date as runs are started, saved and figures are added. Experiments from before
+the catalogue existed (or copied in from a backup) are added with scan(), which only re-reads experiment.yaml
+files that have changed since the last scan.
+
+    >> cat = Catalogue()
+    >> cat.find(identifier="double_dot", start="2024-08-01", where={"ST": (3.2, 3.3)})
+
+Run from libraries/ with `python -m monty.catalogue` to scan DATA_DIR.
+
+@author: james
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+import yaml
+
+
+FNAME = "catalogue.sqlite"
+
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    identifier TEXT PRIMARY KEY,
+    experiment TEXT,
+    version REAL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    identifier TEXT,
+    runname TEXT,
+    runid INTEGER,
+    time_start TEXT,
+    time_end TEXT,
+    parameters TEXT,
+    datafiles TEXT,
+    figures TEXT,
+    PRIMARY KEY (identifier, runname)
+);
+CREATE TABLE IF NOT EXISTS params (
+    identifier TEXT,
+    runname TEXT,
+    name TEXT,
+    value TEXT,
+    number REAL
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    identifier TEXT,
+    runname TEXT,
+    key TEXT,
+    shape TEXT,
+    dtype TEXT,
+    min REAL,
+    max REAL,
+    mean REAL,
+    nan INTEGER,
+    preview TEXT
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_time ON runs (time_start);
+CREATE INDEX IF NOT EXISTS params_run ON params (identifier, runname);
+CREATE INDEX IF NOT EXISTS params_value ON params (name, number);
+CREATE INDEX IF NOT EXISTS summaries_run ON summaries (identifier, runname);
+"""
+
+
+def _json(value) -> str:
+    return json.dumps(value, default=repr)
+
+
+def _number(value):
+    """First number in a parameter value ("Fixed at 3.2V" -> 3.2) or None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(str(value))
+    return float(match.group()) if match else None
+
+
+class Catalogue:
+    """Index of every experiment and run in DATA_DIR."""
+
+    def __init__(self, root: str = None):
+        """root= data directory. Defaults to Monty's DATA_DIR."""
+        if root is None:
+            from .monty import DATA_DIR
+            root = DATA_DIR
+        self.root = root
+        self.path = os.path.join(root, FNAME)
+        self.db = sqlite3.connect(self.path, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update_experiment(self, identifier: str, experiment: dict, version: float):
+        """Add or update an experiment."""
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO experiments VALUES (?, ?, ?)",
+                            (identifier, _json(experiment), version))
+
+    def update_run(self, identifier: str, runname: str, run: dict):
+        """Add or update a run. run is the same dict that Monty saves in experiment.yaml."""
+        parameters = run.get("parameters", {})
+        if not isinstance(parameters, dict):
+            parameters = {"parameters": parameters}
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (
+                identifier, runname, run.get("runid"), run.get("time_start"), run.get("time_end"),
+                _json(parameters), _json(run.get("datafiles", [])), _json(run.get("figures", []))))
+            self.db.execute("DELETE FROM params WHERE identifier = ? AND runname = ?", (identifier, runname))
+            self.db.executemany("INSERT INTO params VALUES (?, ?, ?, ?, ?)", [
+                (identifier, runname, str(name), str(value), _number(value)) for name, value in parameters.items()])
+            self.db.execute("DELETE FROM summaries WHERE identifier = ? AND runname = ?", (identifier, runname))
+            self.db.executemany("INSERT INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                (identifier, runname, key, _json(s.get("shape")), s.get("dtype"), s.get("min"), s.get("max"),
+                 s.get("mean"), s.get("nan"), _json(s.get("preview"))) for key, s in run.get("summary", {}).items()])
+
+    def find(self, identifier: str = None, runname: str = None, start=None, end=None, where: dict = None) -> list:
+        """
+        Find runs.
+
+        identifier= experiment identifier prefix ("double_dot." matches "double_dot.detuning")
+        runname= run name prefix
+        start, end= datetime (or string) range of the run start time
+        where= {parameter: value} where value is either a (low, high) range of the number in the parameter
+               or a string that the parameter must contain
+
+        Returns a list of dicts with identifier, runname, runid, time_start, time_end, parameters, datafiles, figures.
+        """
+        query = "SELECT * FROM runs WHERE 1"
+        args = []
+        if identifier is not None:
+            query += " AND identifier LIKE ? ESCAPE '\\'"
+            args.append(identifier.replace("_", "\\_").replace("%", "\\%") + "%")
+        if runname is not None:
+            query += " AND runname LIKE ? ESCAPE '\\'"
+            args.append(runname.replace("_", "\\_").replace("%", "\\%") + "%")
+        if start is not None:
+            query += " AND time_start >= ?"
+            args.append(str(start))
+        if end is not None:
+            query += " AND time_start <= ?"
+            args.append(str(end))
+        for name, value in (where or {}).items():
+            query += " AND EXISTS (SELECT 1 FROM params p WHERE p.identifier = runs.identifier" \
+                     " AND p.runname = runs.runname AND p.name = ?"
+            if isinstance(value, (tuple, list)):
+                query += " AND p.number BETWEEN ? AND ?)"
+                args += [name, value[0], value[1]]
+            elif isinstance(value, (int, float)):
+                query += " AND p.number = ?)"
+                args += [name, value]
+            else:
+                query += " AND p.value LIKE ?)"
+                args += [name, f"%{value}%"]
+        query += " ORDER BY time_start"
+
+        runs = []
+        for row in self.db.execute(query, args):
+            run = dict(row)
+            for key in ("parameters", "datafiles", "figures"):
+                run[key] = json.loads(run[key])
+            runs.append(run)
+        return runs
+
+    def summaries(self, identifier: str = None, runname: str = None, key: str = None) -> list:
+        """
+        Array summaries saved with the runs (Monty(summaries=True)) without loading any data.
+
+        identifier, runname= prefixes as in find()
+        key= only the summaries of this data key (e.g. "R")
+
+        Returns a list of dicts with identifier, runname, key, shape, dtype, min, max, mean, nan, preview.
+        """
+        query = "SELECT * FROM summaries WHERE identifier LIKE ? ESCAPE '\\' AND runname LIKE ? ESCAPE '\\'"
+        args = [(prefix or "").replace("_", "\\_").replace("%", "\\%") + "%" for prefix in (identifier, runname)]
+        if key is not None:
+            query += " AND key = ?"
+            args.append(key)
+        query += " ORDER BY identifier, runname, key"
+        rows = []
+        for row in self.db.execute(query, args):
+            row = dict(row)
+            row["shape"], row["preview"] = json.loads(row["shape"]), json.loads(row["preview"])
+            rows.append(row)
+        return rows
+
+    def experiments(self, identifier: str = "") -> list:
+        """List the identifiers of all experiments starting with identifier."""
+        rows = self.db.execute("SELECT identifier FROM experiments WHERE identifier LIKE ? ESCAPE '\\'"
+                               " ORDER BY identifier", (identifier.replace("_", "\\_").replace("%", "\\%") + "%",))
+        return [row["identifier"] for row in rows]
+
+    def scan(self, progress: bool = True) -> int:
+        """Index every experiment.yaml under root that has changed since the last scan. Returns the number read."""
+        count = 0
+        for dirpath, _, files in os.walk(self.root):
+            if "experiment.yaml" not in files:
+                continue
+            path = os.path.join(dirpath, "experiment.yaml")
+            stats = [os.stat(p) for p in (path, os.path.join(dirpath, "experiment.journal")) if os.path.exists(p)]
+            mtime, size = max(s.st_mtime for s in stats), sum(s.st_size for s in stats)
+            row = self.db.execute("SELECT mtime, size FROM sources WHERE path = ?", (path,)).fetchone()
+            if row is not None and row["mtime"] == mtime and row["size"] == size:
+                continue
+            try:
+                self.add_yaml(path)
+            except (yaml.YAMLError, KeyError, TypeError) as err:
+                print(f"WARNING: Could not index '{path}': {err}")
+                continue
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (path, mtime, size))
+            count += 1
+            if progress:
+                print(f"\rIndexed {count} experiments", end="")
+        if progress:
+            print("")
+        return count
+
+    def add_yaml(self, path: str):
+        """Index a single experiment.yaml file (and its journal)."""
+        from .monty import RESERVED_KEYWORDS, read_journal, load_yaml
+        experiment = load_yaml(path)
+        for entry in read_journal(os.path.dirname(path)):
+            experiment.update(entry)
+        identifier = experiment["identifier"]
+        self.update_experiment(identifier, experiment["experiment"], experiment.get("version"))
+        for key, run in experiment.items():
+            if key not in RESERVED_KEYWORDS:
+                self.update_run(identifier, key, run)
+
+
+if __name__ == "__main__":
+    cat = Catalogue(sys.argv[1] if len(sys.argv) > 1 else None)
+    t = datetime.now()
+    cat.scan()
+    print(f"Scanned in {datetime.now() - t}. {len(cat.experiments())} experiments, "
+          f"{cat.db.execute('SELECT COUNT(*) FROM runs').fetchone()[0]} runs.")
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:00 2026
+
+Lazy view over many runs of a Monty experiment.
+
+    >> runs = monty.collection(match="P1_scan")
+    >> for R in runs["R"]:  # each array is only loaded when it is needed
+    ..     plt.plot(R)
+    >> runs["R"].stack()  # or all at once if they have the same shape
+
+Arrays are loaded on access and kept in a least recently used cache bounded by the total number of bytes so
+hundreds of runs can be iterated over without holding them all in memory.
+
+@author: james
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+
+class RunCollection:
+    """Lazy collection of runs. Index with a data key (e.g. "R") to get the arrays of every run."""
+
+    def __init__(self, monty, runnames: list, maxbytes: int = 1 << 30):
+        """
+        monty= the Monty experiment that the runs belong to
+        runnames= runs in the collection (in order)
+        maxbytes= maximum total size of the cached arrays
+        """
+        self.monty = monty
+        self.runnames = list(runnames)
+        self.maxbytes = maxbytes
+        self._cache = OrderedDict()  # (runname, key) -> value
+        self._nbytes = 0
+
+    def __repr__(self):
+        return f"RunCollection({self.monty.identifier}, {len(self.runnames)} runs, " \
+               f"{self._nbytes / 1e6:.1f}/{self.maxbytes / 1e6:.1f} MB cached)"
+
+    def __len__(self):
+        return len(self.runnames)
+
+    def __iter__(self):
+        return iter(self.runnames)
+
+    def __getitem__(self, key: str):
+        """View of the value saved under key in every run."""
+        return KeyView(self, key)
+
+    def parameters(self, runname: str) -> dict:
+        """Parameters of a run (from experiment.yaml; doesn't load any data)."""
+        return self.monty.runs[runname]["parameters"]
+
+    def keys(self, runname: str = None) -> list:
+        """Data keys saved in a run (defaults to the first run)."""
+        runname = self.runnames[0] if runname is None else runname
+        return list(self._load(runname).keys())
+
+    def _load(self, runname: str, keys: list = None) -> dict:
+        """Load a run without changing the state of the Monty object."""
+        return self.monty._load_file(self.monty._datapath(runname), keys=keys)["data"]
+
+    def get(self, runname: str, key: str):
+        """Return data[key] of a run. Arrays are fully read into memory and cached."""
+        if (runname, key) in self._cache:
+            self._cache.move_to_end((runname, key))
+            return self._cache[(runname, key)]
+
+        try:
+            value = self._load(runname, [key])[key]
+        except KeyError:
+            raise KeyError(f"ERROR: Run '{runname}' has no data '{key}'")
+        if hasattr(value, "shape") and hasattr(value, "dtype"):
+            value = np.array(value)  # materialise lazy arrays and memory maps
+            value.flags.writeable = False  # shared between everyone that reads the cache
+        self._store((runname, key), value)
+        return value
+
+    def _store(self, item: tuple, value):
+        nbytes = getattr(value, "nbytes", 0)
+        if nbytes > self.maxbytes:
+            return  # never fits
+        self._cache[item] = value
+        self._nbytes += nbytes
+        while self._nbytes > self.maxbytes:
+            _, old = self._cache.popitem(last=False)
+            self._nbytes -= getattr(old, "nbytes", 0)
+
+    def clear(self):
+        """Empty the cache."""
+        self._cache.clear()
+        self._nbytes = 0
+
+
+class KeyView:
+    """The value of one data key across every run in a collection."""
+
+    def __init__(self, collection: RunCollection, key: str):
+        self.collection = collection
+        self.key = key
+
+    def __repr__(self):
+        return f"KeyView('{self.key}', {len(self)} runs)"
+
+    def __len__(self):
+        return len(self.collection)
+
+    def __getitem__(self, run):
+        """Index by position or run name."""
+        runname = self.collection.runnames[run] if isinstance(run, (int, np.integer)) else run
+        return self.collection.get(runname, self.key)
+
+    def __iter__(self):
+        for runname in self.collection.runnames:
+            yield self.collection.get(runname, self.key)
+
+    def items(self):
+        """Iterate over (runname, value)."""
+        for runname in self.collection.runnames:
+            yield runname, self.collection.get(runname, self.key)
+
+    def stack(self) -> np.ndarray:
+        """Stack the arrays of every run into one array. They must all have the same shape."""
+        return np.stack(list(self))
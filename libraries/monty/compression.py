@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:00 2026
+
+Compression codecs used by Monty.
+
+A codec is given as a string "name[:level][+shuffle]", for example "lzma", "lzma:1", "zlib:6+shuffle", "bz2:9"
+or "none". The codec string is saved with every block of a container so loading detects it automatically.
+
+Shuffling stores the first byte of every element, then the second byte of every element, ... which groups
+the (slowly varying) exponent bytes of floats together and usually makes them compress much better.
+
+@author: james
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+import zlib
+import numpy as np
+
+
+CODECS = ["lzma", "zlib", "bz2", "none"]
+DEFAULT_LEVELS = {"lzma": 6, "zlib": 6, "bz2": 9, "none": None}
+
+# Magic bytes at the start of compressed pickle files
+_MAGIC = [
+    (b"\xfd7zXZ\x00", "lzma"),
+    (b"BZh", "bz2"),
+    (b"\x1f\x8b", "zlib"),  # gzip (zlib with a file header)
+]
+
+
+def parse(codec: str):
+    """Split a codec string into (name, level, shuffle)."""
+    name, _, shuffle = codec.partition("+")
+    name, _, level = name.partition(":")
+    if name not in CODECS:
+        raise ValueError(f"ERROR: Unknown codec '{name}'. Must be one of {CODECS}")
+    if shuffle not in ("", "shuffle"):
+        raise ValueError(f"ERROR: Unknown filter '{shuffle}'. Only 'shuffle' is supported")
+    level = int(level) if level else DEFAULT_LEVELS[name]
+    return name, level, shuffle == "shuffle"
+
+
+def shuffle(buf, itemsize: int) -> np.ndarray:
+    """Byte shuffle a buffer of elements of the given size."""
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    return arr.reshape(-1, itemsize).T.reshape(-1)
+
+
+def unshuffle(buf, itemsize: int) -> np.ndarray:
+    """Undo shuffle()."""
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    return arr.reshape(itemsize, -1).T.reshape(-1)
+
+
+def compress(buf, codec: str, itemsize: int = 1):
+    """Compress a buffer. Returns the buffer itself (no copy) for the "none" codec without shuffling."""
+    name, level, shuf = parse(codec)
+    if shuf and itemsize > 1:
+        buf = shuffle(buf, itemsize)
+    if name == "lzma":
+        return lzma.compress(buf, preset=level)
+    if name == "zlib":
+        return zlib.compress(buf, level)
+    if name == "bz2":
+        return bz2.compress(buf, level)
+    return buf
+
+
+def decompress(buf, codec: str, itemsize: int = 1):
+    """Decompress a buffer compressed with compress()."""
+    name, _, shuf = parse(codec)
+    if name == "lzma":
+        buf = lzma.decompress(buf)
+    elif name == "zlib":
+        buf = zlib.decompress(buf)
+    elif name == "bz2":
+        buf = bz2.decompress(buf)
+    if shuf and itemsize > 1:
+        buf = unshuffle(buf, itemsize)
+    return buf
+
+
+def open_pickle(path: str, mode: str = "r", codec: str = "lzma"):
+    """
+    Open a (compressed) pickle file.
+
+    When reading the codec is detected from the magic bytes at the start of the file.
+    When writing path can also be an open (binary) file.
+    """
+    if not isinstance(path, (str, bytes, os.PathLike)):
+        if "r" in mode:
+            raise ValueError("ERROR: Pickle files can only be read from a path")
+        if parse(codec)[0] == "none":
+            return path
+    if "r" in mode:
+        with open(path, "rb") as f:
+            start = f.read(8)
+        codec = next((name for magic, name in _MAGIC if start.startswith(magic)), "none")
+    name, level, _ = parse(codec)
+    mode = mode.replace("b", "") + "b"
+    if name == "lzma":
+        return lzma.open(path, mode, preset=level if "w" in mode else None)
+    if name == "zlib":
+        return gzip.open(path, mode, compresslevel=level)
+    if name == "bz2":
+        return bz2.open(path, mode, compresslevel=level)
+    return open(path, mode)
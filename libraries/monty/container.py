@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:00 2026
+
+Chunked array container used by Monty (the .mty format).
+
+Every top level array in the data dict is stored as its own block of chunks (split along the first axis).
+Everything else (strings, nested dicts, ...) is pickled into its own block, with any arrays inside it written
+out-of-band after the pickle. The header describing the
+shape/dtype/offset of every block is written at the end of the file so the data can be streamed out.
+
+    MAGIC | block | block | ... | header (pickle) | header offset (uint64) | MAGIC
+
+Uncompressed arrays are stored contiguously so that they can be memory mapped. Compressed arrays are
+returned as LazyArray objects which only decompress the chunks that are sliced.
+
+When saved with a ChunkStore (see store.py) the array chunks are kept in the store instead and the block
+table lists their digests along with the path of the store relative to the container.
+
+2D arrays saved with pyramid=True also have their decimation levels (see pyramid.py) stored as array blocks,
+listed under "levels" in the array's block table entry.
+
+@author: james
+"""
+
+import os
+import pickle
+import struct
+import numpy as np
+
+from . import compression
+from .fileio import atomic_write
+from .store import digest
+from .pyramid import haslevels, levels, decimate, nlevels, STATS
+
+
+MAGIC = b"MONTYMTY"
+FORMAT_VERSION = 2  # 2: arrays inside pickled values are stored out-of-band
+CHUNK_BYTES = 1 << 20  # target (uncompressed) size of a single chunk
+ALIGN = 64  # byte alignment of uncompressed arrays so they can be memory mapped
+
+_TRAILER = struct.Struct("<Q8s")  # header offset, magic
+
+
+def iscontainer(path: str) -> bool:
+    """Check if the file at path is a Monty container."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _mappable(codec: str) -> bool:
+    """If blocks written with this codec are stored as is (and so can be memory mapped)."""
+    name, _, shuffle = compression.parse(codec)
+    return name == "none" and not shuffle
+
+
+def _buffer(arr: np.ndarray) -> memoryview:
+    """Raw bytes of a contiguous array without copying."""
+    return memoryview(arr.reshape(-1).view(np.uint8))
+
+
+def _isarray(value) -> bool:
+    """Only plain numeric arrays get their own chunked block. Everything else is pickled."""
+    if isinstance(value, LazyArray):
+        return True
+    return isinstance(value, np.ndarray) and value.ndim > 0 and not value.dtype.hasobject
+
+
+def _rows_per_chunk(arr: np.ndarray) -> int:
+    row_bytes = max(1, arr.nbytes // max(1, arr.shape[0]))
+    return max(1, CHUNK_BYTES // row_bytes)
+
+
+def save(path: str, data: dict, meta: dict, codec: str = "lzma", store=None, wal=None, pyramid: bool = False):
+    """
+    Save the data dict to path.
+
+    meta is stored alongside the block table in the header (runname, version, info, ...).
+    codec is any codec string from compression.py. Arrays saved with "none" can be memory mapped on load.
+    store= ChunkStore to deduplicate the array chunks in. Chunks that are already stored aren't compressed again.
+    wal= WriteAheadLog to record the write in (see fileio.py). The file is always replaced atomically
+    pyramid= also store the mean/min/max decimation levels of 2D arrays (see pyramid.py)
+    """
+    compression.parse(codec)  # fail before writing anything
+    entries = {}
+    names = []
+    with atomic_write(path, "wb", wal) as f:
+        f.write(MAGIC)
+        for key, value in data.items():
+            if _isarray(value):
+                arr = value if isinstance(value, LazyArray) else np.asarray(value)
+                entries[key] = _dumparray(f, path, arr, codec, store, names)
+                if pyramid and haslevels(arr):
+                    entries[key]["levels"] = [{stat: _dumparray(f, path, x, codec, store, names)
+                                               for stat, x in level.items()} for level in levels(arr)]
+            else:
+                entries[key] = _dumpobject(f, value, codec)
+
+        offset = f.tell()
+        pickle.dump({"format": FORMAT_VERSION, "meta": meta, "entries": entries}, f, 4)
+        f.write(_TRAILER.pack(offset, MAGIC))
+    if store is not None:
+        store.reference(path, names)
+
+
+def _dumparray(f, path: str, arr, codec: str, store, names: list) -> dict:
+    """Write an array block (or its chunks to the store, adding their digests to names)."""
+    single = _mappable(codec) and store is None
+    step = _rows_per_chunk(arr)
+    entry = {
+        "kind": "array",
+        "shape": arr.shape,
+        "dtype": arr.dtype.str,
+        "codec": codec,
+        "rows": max(1, arr.shape[0]) if single else step,
+        "chunks": [],
+    }
+    if store is not None:
+        entry["store"] = os.path.relpath(store.root, os.path.dirname(os.path.abspath(path)))
+    elif single:  # one aligned chunk that can be memory mapped
+        f.write(b"\0" * (-f.tell() % ALIGN))
+        offset = f.tell()
+        for start in range(0, arr.shape[0], step):  # straight from the array's memory
+            f.write(_buffer(np.ascontiguousarray(arr[start:start + step])))
+        entry["chunks"].append((offset, f.tell() - offset))
+        return entry
+    for start in range(0, max(1, arr.shape[0]), entry["rows"]):
+        rows = np.ascontiguousarray(arr[start:start + entry["rows"]])  # LazyArrays are read chunk by chunk
+        if store is not None:
+            name = digest(_buffer(rows), codec, arr.dtype.itemsize)
+            if not store.touch(name):
+                store.put(name, compression.compress(_buffer(rows), codec, arr.dtype.itemsize))
+            entry["chunks"].append(name)
+            names.append(name)
+            continue
+        buf = compression.compress(_buffer(rows), codec, arr.dtype.itemsize)
+        entry["chunks"].append((f.tell(), memoryview(buf).nbytes))
+        f.write(buf)
+    return entry
+
+
+def readheader(path: str) -> dict:
+    """Read only the header (block table and meta) of a container."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise OSError(f"ERROR: '{path}' is not a Monty container")
+        f.seek(-_TRAILER.size, 2)
+        offset, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+        if magic != MAGIC:
+            raise OSError(f"ERROR: '{path}' is truncated (missing trailer)")
+        f.seek(offset)
+        header = pickle.load(f)
+    if header["format"] > FORMAT_VERSION:
+        raise OSError(f"ERROR: '{path}' was saved by a newer version of Monty (format {header['format']})")
+    return header
+
+
+def _readinto(f, buf: memoryview) -> memoryview:
+    """Fill buf from f."""
+    if f.readinto(buf) != buf.nbytes:
+        raise OSError(f"ERROR: '{f.name}' is truncated")
+    return buf
+
+
+def _dumpobject(f, value, codec: str) -> dict:
+    """
+    Write a pickled value. Arrays inside it (e.g. a dict of fit results) are written out-of-band (protocol 5)
+    straight from their memory instead of being copied into the pickle.
+    """
+    buffers = []
+
+    def outofband(buf: pickle.PickleBuffer) -> bool:
+        try:
+            buffers.append(buf.raw())
+        except BufferError:  # not contiguous, keep it in the pickle
+            return True
+        return False
+
+    buf = compression.compress(memoryview(pickle.dumps(value, 5, buffer_callback=outofband)), codec)
+    entry = {"kind": "object", "codec": codec, "offset": f.tell(), "nbytes": memoryview(buf).nbytes, "buffers": []}
+    f.write(buf)
+    for raw in buffers:
+        buf = compression.compress(raw, codec)
+        entry["buffers"].append((f.tell(), memoryview(buf).nbytes))
+        f.write(buf)
+    return entry
+
+
+def _readobject(path: str, entry: dict):
+    """Unpickle a value. Uncompressed out-of-band buffers are read straight into the memory the arrays use."""
+    buffers = []
+    with open(path, "rb") as f:
+        f.seek(entry["offset"])
+        data = compression.decompress(f.read(entry["nbytes"]), entry["codec"])
+        for offset, nbytes in entry.get("buffers", []):
+            f.seek(offset)
+            if _mappable(entry["codec"]):
+                buffers.append(_readinto(f, memoryview(bytearray(nbytes))))
+            else:
+                # bytearray so the arrays are writable (pickle uses the buffer as the array memory)
+                buffers.append(memoryview(bytearray(compression.decompress(f.read(nbytes), entry["codec"]))))
+    return pickle.loads(data, buffers=buffers)
+
+
+def _storepath(path: str, entry: dict, name: str) -> str:
+    """Path of a chunk in the store a container was saved with."""
+    root = os.path.join(os.path.dirname(os.path.abspath(path)), entry["store"])
+    return os.path.join(root, name[:2], name[2:])
+
+
+def storedigests(path: str) -> list:
+    """Digests of the store chunks used by a container."""
+    names = []
+    for entry in readheader(path)["entries"].values():
+        for block in [entry] + [x for level in entry.get("levels", []) for x in level.values()]:
+            if "store" in block:
+                names += block["chunks"]
+    return names
+
+
+def _readarray(path: str, entry: dict, lazy: bool):
+    shape = tuple(entry["shape"])
+    dtype = np.dtype(entry["dtype"])
+    if _mappable(entry["codec"]) and len(entry["chunks"]) == 1 and lazy and 0 not in shape:
+        if "store" in entry:
+            return np.memmap(_storepath(path, entry, entry["chunks"][0]), dtype=dtype, mode="r", shape=shape)
+        return np.memmap(path, dtype=dtype, mode="r", offset=entry["chunks"][0][0], shape=shape)
+    arr = LazyArray(path, entry)
+    return arr if lazy else np.asarray(arr)
+
+
+def _select(available, keys, path: str) -> list:
+    """The keys to load (all of them if keys is None)."""
+    if keys is None:
+        return list(available)
+    missing = [key for key in keys if key not in available]
+    if missing:
+        raise KeyError(f"ERROR: '{path}' has no data {missing}")
+    return list(keys)
+
+
+def _readlevel(path: str, entry: dict, lazy: bool, level: int, stat: str):
+    """Read a decimation level of an array. Levels that weren't saved are computed from the full array."""
+    if stat not in STATS:
+        raise ValueError(f"ERROR: Unknown statistic '{stat}'. Must be one of {STATS}")
+    if level > 0 and entry.get("levels"):
+        saved = entry["levels"][min(level, len(entry["levels"])) - 1]
+        return _readarray(path, saved.get(stat, saved["mean"]), lazy)
+    if level > 0 and len(entry["shape"]) == 2 and nlevels(entry["shape"]) > 0:
+        return decimate(_readarray(path, entry, False), level, stat)
+    return _readarray(path, entry, lazy)
+
+
+def load(path: str, lazy: bool = True, keys: list = None, level: int = 0, stat: str = "mean") -> dict:
+    """
+    Load a container.
+
+    Returns a dict of the same form as the pickled Monty files ({"data": ..., **meta}).
+    If lazy, arrays are returned as memory maps (uncompressed) or LazyArrays (compressed).
+    keys= only read these keys of data. The blocks of the other keys are never read from disk
+    level= return 2D arrays reduced over 2^level x 2^level blocks (see pyramid.py). Read straight from the file
+           if it was saved with a pyramid
+    stat= "mean", "min" or "max" of each block
+    """
+    header = readheader(path)
+    data = {}
+    for key in _select(header["entries"], keys, path):
+        entry = header["entries"][key]
+        if entry["kind"] == "array":
+            data[key] = _readlevel(path, entry, lazy, level, stat)
+        else:
+            data[key] = _readobject(path, entry)
+    return {**header["meta"], "data": data}
+
+
+class LazyArray(np.lib.mixins.NDArrayOperatorsMixin):
+    """
+    Read only array backed by a compressed container block.
+
+    Slicing along the first axis only decompresses the chunks that are needed. Any other operation
+    (arithmetic, np functions) loads the full array.
+    """
+
+    def __init__(self, path: str, entry: dict):
+        self.path = path
+        self.shape = tuple(entry["shape"])
+        self.dtype = np.dtype(entry["dtype"])
+        self._entry = entry
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"LazyArray(shape={self.shape}, dtype={self.dtype}, chunks={len(self._entry['chunks'])})"
+
+    def _rows(self, start: int, stop: int) -> np.ndarray:
+        """Decompress the rows [start, stop) only. Whole uncompressed chunks are read straight into the result."""
+        out = np.empty((max(0, stop - start),) + self.shape[1:], dtype=self.dtype)
+        rows = self._entry["rows"]
+        name, _, shuffle = compression.parse(self._entry["codec"])
+        with open(self.path, "rb") as f:
+            for c in range(start // rows, (stop - 1) // rows + 1 if stop > start else 0):
+                lo = max(start, c * rows)
+                hi = min(stop, (c + 1) * rows, self.shape[0])
+                if name == "none" and not shuffle and lo == c * rows and hi == min((c + 1) * rows, self.shape[0]):
+                    self._readchunk(f, c, _buffer(out[lo - start:hi - start]))
+                    continue
+                buf = compression.decompress(self._readchunk(f, c), self._entry["codec"], self.dtype.itemsize)
+                chunk = np.frombuffer(buf, dtype=self.dtype)
+                chunk = chunk.reshape((-1,) + self.shape[1:])
+                out[lo - start:hi - start] = chunk[lo - c * rows:hi - c * rows]
+        return out
+
+    def _readchunk(self, f, c: int, into: memoryview = None):
+        """Compressed bytes of chunk c, or read them into the buffer into. f is the open container."""
+        if "store" in self._entry:
+            with open(_storepath(self.path, self._entry, self._entry["chunks"][c]), "rb") as chunk:
+                return chunk.read() if into is None else _readinto(chunk, into)
+        offset, nbytes = self._entry["chunks"][c]
+        f.seek(offset)
+        return f.read(nbytes) if into is None else _readinto(f, into)
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        if len(index) == 0 or index[0] is Ellipsis:
+            return np.asarray(self)[index]
+        first, rest = index[0], index[1:]
+
+        if isinstance(first, (int, np.integer)):
+            i = int(first) + (self.shape[0] if first < 0 else 0)
+            if not 0 <= i < self.shape[0]:
+                raise IndexError(f"index {first} is out of bounds for axis 0 with size {self.shape[0]}")
+            return self._rows(i, i + 1)[(0,) + rest]
+        if isinstance(first, slice):
+            start, stop, step = first.indices(self.shape[0])
+            if step > 0:
+                stop = max(start, stop)
+                return self._rows(start, stop)[(slice(None, None, step),) + rest]
+        return np.asarray(self)[index]  # fancy indexing etc. Just load everything
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self._rows(0, self.shape[0])
+        return arr if dtype is None else arr.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(np.asarray(x) if isinstance(x, LazyArray) else x for x in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
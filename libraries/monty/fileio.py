@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:00 2026
+
+Crash safe file writes for Monty.
+
+Every file is written to a temporary file next to it, flushed to disk and then renamed over the destination.
+A crash (or power failure) part way through a save leaves the previous version of the file (or no file) in place
+instead of a truncated one.
+
+The optional write-ahead log (.monty.<host>.<pid>.wal in the experiment directory, one per process) records each
+write before it happens:
+
+    begin   the temporary file is about to be written
+    commit  the temporary file is complete and on disk
+    done    the temporary file has been renamed over the destination
+
+On recovery committed writes are finished (renamed) and the temporary files of unfinished writes are removed.
+Appends (experiment.journal) record the size of the file before the append and are truncated back to it
+if the append didn't finish. The logs of other processes are only recovered once the process has exited (or, for
+processes on another computer, when the log hasn't changed for a long time).
+
+FileLock is an advisory lock between processes (e.g. a measurement and an analysis notebook) that use the same
+experiment. It is a lock file created exclusively; a lock file whose process on this computer has exited, or that
+hasn't been released for a long time, is assumed to belong to a process that crashed and is broken.
+
+@author: james
+"""
+
+import glob
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+
+WAL_PATTERN = ".monty.*.wal"
+LOCK_FNAME = ".monty.lock"
+STALE = 300.0  # seconds after which a lock (or an unfinished write) is assumed to belong to a crashed process
+
+
+def fsync_dir(path: str):
+    """Make a rename in the directory durable. Not possible (or needed) on Windows."""
+    if os.name == "posix":
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _alive(pid: int) -> bool:
+    """Check if a process on this computer is still running."""
+    if os.name == "posix":
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:  # someone else's process
+            return True
+        return True
+    import ctypes
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not handle:
+        return False
+    code = ctypes.c_ulong()
+    kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+    kernel32.CloseHandle(handle)
+    return code.value == 259  # STILL_ACTIVE
+
+
+def _crashed(owner: str) -> bool:
+    """Check if the lock file contents ("host pid ...") belong to a process on this computer that has exited."""
+    fields = owner.split()
+    if len(fields) < 2 or fields[0] != socket.gethostname() or not fields[1].isdigit():
+        return False  # another computer (or the lock file is still being written)
+    return not _alive(int(fields[1]))
+
+
+def _sync(f, tmp: str):
+    """Flush a file to disk. Wrappers (e.g. lzma) may already have closed it, then reopen it."""
+    if f.closed:
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        return
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb", wal=None):
+    """
+    Open a temporary file to write path with. It replaces path once the block finishes without an error.
+
+    wal= WriteAheadLog to record the write in
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if wal is not None:
+        wal.log("begin", path, tmp)
+    f = open(tmp, mode)
+    try:
+        yield f
+        _sync(f, tmp)
+    except BaseException:
+        f.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if wal is not None:
+            wal.log("done", path, tmp)
+        raise
+    if wal is not None:
+        wal.log("commit", path, tmp)
+    os.replace(tmp, path)
+    fsync_dir(os.path.dirname(os.path.abspath(path)))
+    if wal is not None:
+        wal.log("done", path, tmp)
+
+
+@contextmanager
+def append(path: str, mode: str = "a", wal=None):
+    """Open path to append to. The appended data is flushed to disk before returning."""
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if wal is not None:
+        wal.log("append", path, size=size)
+    with open(path, mode) as f:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+    if wal is not None:
+        wal.log("done", path)
+
+
+class FileLock:
+    """Advisory lock shared between processes and threads."""
+
+    def __init__(self, path: str, timeout: float = 60.0, stale: float = STALE):
+        """
+        path= lock file
+        timeout= seconds to wait for the lock before raising an error
+        stale= seconds after which a lock that hasn't been released is broken
+        """
+        self.path = path
+        self.timeout = timeout
+        self.stale = stale
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._owner = None  # contents of the lock file while we hold it
+
+    def acquire(self):
+        self._lock.acquire()  # other threads of this process wait here
+        self._depth += 1
+        if self._depth > 1:
+            return
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                owner = self.owner()
+                try:
+                    age = time.time() - os.path.getmtime(self.path)
+                except FileNotFoundError:
+                    continue  # just released
+                if age > self.stale or _crashed(owner):
+                    self._break(owner)
+                    continue
+                if time.monotonic() > deadline:
+                    self._depth -= 1
+                    self._lock.release()
+                    raise OSError(f"ERROR: Timed out waiting for '{self.path}' (held by {self.owner()})")
+                time.sleep(0.01)
+                continue
+            self._owner = f"{socket.gethostname()} {os.getpid()} {os.urandom(4).hex()}"
+            os.write(fd, self._owner.encode())
+            os.close(fd)
+            return
+
+    def _break(self, owner: str):
+        """
+        Remove a stale lock. Renamed first so only one waiter removes it.
+
+        owner= contents of the lock file that was found to be stale. If another waiter broke it first and a new
+               process holds the lock by now, the new lock is put back.
+        """
+        stale = f"{self.path}.{os.getpid()}.{threading.get_ident()}.stale"
+        try:
+            os.replace(self.path, stale)
+        except FileNotFoundError:
+            return
+        with open(stale, "r") as f:
+            taken = f.read()
+        if taken != owner:
+            try:
+                os.link(stale, self.path)
+            except OSError:  # yet another process has taken the lock
+                pass
+        os.remove(stale)
+
+    def owner(self) -> str:
+        """Host and pid of the process holding the lock."""
+        try:
+            with open(self.path, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return "nobody"
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            mine, self._owner = self._owner, None
+            owner = self.owner()
+            if owner == mine:
+                os.remove(self.path)
+            else:  # broken while we held it. Leave the lock of whoever has it now
+                print(f"WARNING: Lock '{self.path}' was broken while held. It is now held by {owner}")
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class WriteAheadLog:
+    """Log of the writes in progress in a directory (see the module docstring)."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, WAL_PATTERN.replace("*", f"{socket.gethostname()}.{os.getpid()}"))
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def log(self, op: str, path: str, tmp: str = None, size: int = None):
+        """Durably record an operation. Paths are saved relative to root."""
+        record = {"op": op, "path": os.path.relpath(path, self.root)}
+        if tmp is not None:
+            record["tmp"] = os.path.relpath(tmp, self.root)
+        if size is not None:
+            record["size"] = size
+        with self._lock:
+            self._pending += {"begin": 1, "append": 1, "done": -1}.get(op, 0)
+            if op == "done" and self._pending == 0:
+                with open(self.path, "w"):  # nothing in progress, start the log again
+                    return
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def _records(path: str) -> list:
+        records = []
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:  # torn last record
+                    break
+        return records
+
+    def recover(self) -> list:
+        """
+        Finish or undo every write that was in progress when a process (this one or another) crashed.
+
+        Returns a description of what was done. Call with the experiment lock held.
+        """
+        actions = []
+        for wal in glob.glob(os.path.join(self.root, WAL_PATTERN)):
+            if wal != self.path and self._running(wal):
+                continue
+            try:
+                actions += self._recover(self._records(wal))
+                os.remove(wal)
+            except FileNotFoundError:  # recovered by another process at the same time
+                continue
+        if actions:
+            fsync_dir(self.root)
+        with self._lock:
+            self._pending = 0
+        return actions
+
+    @staticmethod
+    def _running(wal: str) -> bool:
+        """If the process that owns a log may still be writing."""
+        host, _, pid = os.path.basename(wal)[len(".monty."):-len(".wal")].rpartition(".")
+        if host == socket.gethostname() and pid.isdigit():
+            return _alive(int(pid))
+        try:
+            return time.time() - os.path.getmtime(wal) < STALE
+        except FileNotFoundError:
+            return False
+
+    def _recover(self, records: list) -> list:
+        state = {}  # (path, tmp) -> last record
+        for record in records:
+            key = (record["path"], record.get("tmp"))
+            if record["op"] == "done":
+                state.pop(key, None)
+            else:
+                state[key] = record
+        actions = []
+        for (path, tmp), record in state.items():
+            path = os.path.join(self.root, path)
+            if record["op"] == "commit" and os.path.exists(os.path.join(self.root, tmp)):
+                os.replace(os.path.join(self.root, tmp), path)
+                actions.append(f"finished writing '{path}'")
+            elif record["op"] in ("begin", "commit"):
+                if os.path.exists(os.path.join(self.root, tmp)):
+                    os.remove(os.path.join(self.root, tmp))
+                    actions.append(f"removed incomplete '{os.path.join(self.root, tmp)}'")
+                if os.path.exists(path) and os.path.getsize(path) == 0:  # name reserved for the write
+                    os.remove(path)
+            elif record["op"] == "append" and os.path.exists(path) and os.path.getsize(path) > record["size"]:
+                os.truncate(path, record["size"])
+                actions.append(f"removed incomplete append to '{path}'")
+        return actions
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:00 2026
+
+Convert the LZMA pickle (.xz) files of the experiments in DATA_DIR into containers (.mty).
+
+Only files in experiment directories (with an experiment.yaml) are migrated. Monty 1.1 archives at the top of
+DATA_DIR are loaded by name by monty11.py so they are left alone. convert() reads both 1.1 files (fname,
+experiment, data, version, time) and 1.3 files (runname, data, version, info). Everything apart from data is kept in the container meta so loading a converted file returns exactly
+the same dict as before. Every converted file is read back and compared to the original before it is used.
+
+Files are converted in parallel. Once every file of an experiment has been converted the datafiles in its
+experiment.yaml are pointed at the new files (the yaml is replaced atomically). The original files are only
+deleted with --delete, and only after experiment.yaml has been updated.
+
+Run from libraries/ with
+    python -m monty.migrate [DATA_DIR] [--codec lzma] [--workers N] [--dedup] [--delete] [--dry-run]
+
+@author: james
+"""
+
+import argparse
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from . import container
+from .raw import loadfile
+from .fileio import FileLock, LOCK_FNAME
+from .store import ChunkStore, DIRNAME as STORE_DIR
+
+
+def find(root: str) -> list:
+    """Every .xz file in the experiment directories under root."""
+    paths = []
+    for dirpath, dirnames, files in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in (STORE_DIR, "logs")]
+        if "experiment.yaml" not in files:
+            continue
+        paths += [os.path.join(dirpath, fname) for fname in sorted(files) if fname.endswith(".xz")]
+    return paths
+
+
+def equal(a, b) -> bool:
+    """Check two loaded values are the same (arrays must have the same dtype and shape, NaNs are equal)."""
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        a, b = np.asarray(a), np.asarray(b)
+        if a.dtype != b.dtype or a.shape != b.shape:
+            return False
+        if a.dtype.hasobject:
+            return all(equal(x, y) for x, y in zip(a.reshape(-1), b.reshape(-1)))
+        return np.array_equal(a, b, equal_nan=a.dtype.kind in "fc")
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(equal(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(equal(x, y) for x, y in zip(a, b))
+    try:
+        return bool(a == b) or pickle.dumps(a, 4) == pickle.dumps(b, 4)
+    except Exception:  # objects that can't be compared
+        return pickle.dumps(a, 4) == pickle.dumps(b, 4)
+
+
+def convert(path: str, codec: str = "lzma", store: str = None, dryrun: bool = False) -> dict:
+    """
+    Convert a single .xz file to .mty next to it. The original is left in place.
+
+    store= root of the chunk store to deduplicate the arrays in (see store.py)
+
+    Returns a dict with the new path, sizes, the (uncompressed) number of array bytes, the read time of the
+    original and the converted file, or the error.
+    """
+    newpath = path[:-len(".xz")] + ".mty"
+    result = {"path": path, "newpath": newpath, "size": os.path.getsize(path), "error": None}
+    try:
+        if os.path.exists(newpath):
+            raise OSError(f"ERROR: '{newpath}' already exists")
+        t = time.perf_counter()
+        saved = loadfile(path, lazy=False)
+        result["read"] = time.perf_counter() - t
+        if not isinstance(saved, dict) or not isinstance(saved.get("data"), dict):
+            raise ValueError("ERROR: Not a Monty file (data is not a dict)")
+        data = saved["data"]
+        meta = {key: value for key, value in saved.items() if key != "data"}
+        result["nbytes"] = sum(value.nbytes for value in data.values() if isinstance(value, np.ndarray))
+        if dryrun:
+            return result
+
+        chunks = ChunkStore(store) if store is not None else None
+        tmp = newpath + ".tmp"
+        try:
+            container.save(tmp, data, meta, codec, chunks)
+            t = time.perf_counter()
+            loaded = container.load(tmp, lazy=False)
+            result["newread"] = time.perf_counter() - t
+            if not equal(loaded, saved):
+                raise ValueError("ERROR: Converted file does not match the original")
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp, newpath)
+            if chunks is not None:
+                chunks.reference(newpath, container.storedigests(newpath))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if chunks is not None:
+                chunks.reference(tmp, [])
+                chunks.close()
+        result["newsize"] = os.path.getsize(newpath)
+    except Exception as err:
+        result["error"] = str(err)
+    return result
+
+
+def update_experiment(root: str, converted: dict):
+    """
+    Point the datafiles of an experiment at the converted files.
+
+    converted= {old fname: new fname} of the files in root
+    """
+    from .monty import read_experiment, write_experiment, RESERVED_KEYWORDS
+    with FileLock(os.path.join(root, LOCK_FNAME)):  # a notebook may have the experiment open
+        experiment, _ = read_experiment(root)
+        header = {key: experiment[key] for key in experiment if key in RESERVED_KEYWORDS}
+        runs = {key: value for key, value in experiment.items() if key not in RESERVED_KEYWORDS}
+        changed = 0
+        for run in runs.values():
+            if isinstance(run, dict) and "datafiles" in run:
+                changed += sum(fname in converted for fname in run["datafiles"])
+                run["datafiles"] = [converted.get(fname, fname) for fname in run["datafiles"]]
+        if changed:
+            write_experiment(root, header, runs)
+        return changed
+
+
+def migrate(root: str, codec: str = "lzma", workers: int = None, dedup: bool = False, delete: bool = False,
+            dryrun: bool = False) -> list:
+    """Convert every .xz file under root. Returns the result of every file (see convert)."""
+    paths = find(root)
+    print(f"Found {len(paths)} files to convert in '{root}'")
+    store = os.path.join(root, STORE_DIR) if dedup else None
+    storesize = ChunkStore(store).stats()["bytes"] if dedup and not dryrun else 0
+    results = []
+    t = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(convert, path, codec, store, dryrun) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result["error"] is not None:
+                print(f"\nWARNING: Could not convert '{result['path']}': {result['error']}")
+            print(f"\rConverted {len(results)}/{len(paths)} files", end="")
+    print("")
+    elapsed = time.perf_counter() - t
+
+    # update the references of the experiments that have been converted
+    done = [r for r in results if r["error"] is None and not dryrun]
+    experiments = {}
+    for result in done:
+        experiments.setdefault(os.path.dirname(result["path"]), {})[
+            os.path.basename(result["path"])] = os.path.basename(result["newpath"])
+    for dirpath, converted in experiments.items():
+        if not os.path.exists(os.path.join(dirpath, "experiment.yaml")):
+            continue  # removed while converting. Keep the originals
+        update_experiment(dirpath, converted)
+        if delete:  # only once experiment.yaml no longer references them
+            for fname in converted:
+                os.remove(os.path.join(dirpath, fname))
+
+    ok = [r for r in results if r["error"] is None]
+    size = sum(r["size"] for r in ok)
+    nbytes = sum(r["nbytes"] for r in ok)
+    print(f"Converted {len(ok)} files ({len(results) - len(ok)} failed) in {elapsed:.1f} s: "
+          f"{nbytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s of array data, {len(ok) / max(elapsed, 1e-9):.1f} files/s")
+    if done:
+        newsize = sum(r["newsize"] for r in done)
+        if dedup:
+            newsize += ChunkStore(store).stats()["bytes"] - storesize
+        read = sum(r["read"] for r in done)
+        newread = sum(r["newread"] for r in done)
+        print(f"Size {size / 1e6:.1f} MB -> {newsize / 1e6:.1f} MB (saved {(size - newsize) / 1e6:.1f} MB). "
+              f"Full read time {read:.1f} s -> {newread:.1f} s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert Monty .xz files into .mty containers")
+    parser.add_argument("root", nargs="?", default=None, help="data directory (defaults to DATA_DIR)")
+    parser.add_argument("--codec", default="lzma", help="container codec (see compression.py)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--dedup", action="store_true", help="store array chunks in the shared chunk store")
+    parser.add_argument("--delete", action="store_true", help="delete the .xz files once converted")
+    parser.add_argument("--dry-run", action="store_true", help="only read the files")
+    args = parser.parse_args()
+    if args.root is None:
+        from .monty import DATA_DIR
+        args.root = DATA_DIR
+    migrate(args.root, args.codec, args.workers, args.dedup, args.delete, args.dry_run)
@@ -8,13 +8,27 @@ Data saver using pickle and LZMA
 """
 
 
-import lzma
 import pickle
 import os
+import copy
+import hashlib
 import sys
+import tempfile
 from datetime import datetime
 import yaml
 import logging
+import numpy as np
+import sqlite3
+
+from . import container, stream, compression
+from .container import LazyArray
+from .writer import BackgroundWriter
+from .catalogue import Catalogue
+from .collection import RunCollection
+from .store import ChunkStore, DIRNAME as STORE_DIR
+from .fileio import atomic_write, append, WriteAheadLog, FileLock, LOCK_FNAME
+from .raw import loadfile
+from . import bulk, cache, summary
 
 
 if os.name == "posix":  # mac or linux
@@ -24,11 +38,28 @@ if os.name == "posix":  # mac or linux
 else:  # Windows (Probably LD fridge)
     DATA_DIR = "C:\\Users\\LD2007\\Documents\\Si_CMOS_james\\data"
 VERSION = 1.3
+FORMATS = ["mty", "xz"]  # chunked container, LZMA pickle. Order is the lookup order when loading
+STREAM_EXT = "log"  # append only run logs written while streaming
 
 # run names cannot be the following as they would collide with internal identifiers
 RESERVED_KEYWORDS = ["version", "identifier", "experiment", "runs"]
 
-# Configure yaml to dump unknown objects as `repr(object)`
+# Updated runs are appended to experiment.journal and merged into experiment.yaml after this many updates
+COMPACT_EVERY = 50
+
+# Keys every saved run has. Journal entries without them were torn while being written
+RUN_KEYS = ["runid", "time_start", "time_end", "parameters", "figures", "datafiles"]
+_END = "\n...\n"  # end of a journal entry
+
+# Binary copy of the parsed experiment.yaml. Bump the version if the cached structure changes
+CACHE_FNAME = ".experiment.cache"
+CACHE_VERSION = 1
+
+# Use the libyaml (C) loader and dumper when available. They are much faster than the pure python ones
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Configure yaml to dump unknown objects as `repr(object)` (the representers are shared with the C dumper)
 yaml.SafeDumper.yaml_representers[None] = lambda self, data: \
     yaml.representer.SafeRepresenter.represent_str(
         self,
@@ -36,17 +67,178 @@ yaml.SafeDumper.yaml_representers[None] = lambda self, data: \
     )
 
 
+def load_yaml(path: str) -> dict:
+    """
+    Load an experiment.yaml file.
+
+    The parsed file is cached in a binary sidecar (.experiment.cache) which is used while the yaml file has the same
+    mtime and size, or the same contents (sha1) if it has been touched or copied.
+    """
+    cache = os.path.join(os.path.dirname(path), CACHE_FNAME)
+    stat = os.stat(path)
+    try:
+        with open(cache, "rb") as f:
+            cached = pickle.load(f)
+        if cached["version"] != CACHE_VERSION:
+            cached = None
+    except Exception:  # missing or corrupt. The cache is disposable
+        cached = None
+    if cached is not None and cached["mtime"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+        return cached["experiment"]
+
+    with open(path, "rb") as yf:
+        raw = yf.read()
+    digest = hashlib.sha1(raw).hexdigest()
+    if cached is not None and cached["sha1"] == digest:
+        experiment = cached["experiment"]
+    else:
+        experiment = yaml.load(raw, Loader=YamlLoader)
+    try:
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(cache))  # other readers write it too
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({"version": CACHE_VERSION, "mtime": stat.st_mtime_ns, "size": stat.st_size,
+                             "sha1": digest, "experiment": experiment}, f, 4)
+            os.replace(tmp, cache)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    except OSError:
+        pass  # read only data directory. Just don't cache
+    return experiment
+
+
+def read_journal(root: str) -> list:
+    """
+    Read the runs that have been updated since experiment.yaml was last written.
+
+    Returns a list of {runname: run} entries in the order they were written. Every entry ends with an end of
+    document marker ("...") so an entry torn by a crash while writing is ignored even when what was written is
+    still valid yaml. Entries without all the RUN_KEYS are ignored too (journals from before the markers).
+    """
+    path = os.path.join(root, "experiment.journal")
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    logger = logging.getLogger("monty")
+    with open(path, "r") as yf:
+        text = yf.read()
+    if text.endswith("\n..."):
+        text += "\n"
+    documents = text.split(_END)
+    if len(documents) > 1 and documents[-1].strip():
+        logger.warning("WARNING: Ignoring the unfinished entry at the end of the experiment journal")
+    if len(documents) > 1:
+        documents.pop()
+    for document in documents:
+        try:
+            for entry in yaml.load_all(document, Loader=YamlLoader):
+                if entry is None:
+                    continue
+                if not isinstance(entry, dict) or not all(isinstance(run, dict) and all(key in run for key in RUN_KEYS)
+                                                          for run in entry.values()):
+                    logger.warning(f"WARNING: Ignoring the incomplete experiment journal entry "
+                                   f"{list(entry) if isinstance(entry, dict) else entry}")
+                    continue
+                entries.append(entry)
+        except yaml.YAMLError as err:
+            logger.warning(f"WARNING: Ignoring a torn experiment journal entry: '{err}'")
+    return entries
+
+
+def read_experiment(root: str):
+    """
+    Read experiment.yaml and apply the runs updated since it was last written.
+
+    Returns the experiment and the number of journal entries. Hold the experiment lock while reading so the
+    journal can't be compacted part way through.
+    """
+    experiment = load_yaml(os.path.join(root, "experiment.yaml"))
+    journal = read_journal(root)
+    for entry in journal:
+        for run, info in entry.items():
+            experiment[run] = info
+            if "runs" in experiment and run not in experiment["runs"]:
+                experiment["runs"].append(run)
+    return experiment, len(journal)
+
+
+def write_experiment(root: str, header: dict, runs: dict, wal: WriteAheadLog = None):
+    """
+    Write experiment.yaml (header then every run) and clear the journal.
+
+    The file is written next to the old one and renamed over it so a crash never leaves a half written file.
+    """
+    path = os.path.join(root, "experiment.yaml")
+    with atomic_write(path, 'w', wal) as yf:
+        yf.write(f"# << This file is machine generated. Last updated {datetime.now().isoformat()}. Do not edit directly. >>\n")
+        yf.write(yaml.dump(header, Dumper=YamlDumper))
+        yf.write("\n")
+        for run in runs.keys():
+            yf.write(yaml.dump({
+                run: runs[run]
+            }, Dumper=YamlDumper))
+            yf.write("\n")
+    journal = os.path.join(root, "experiment.journal")
+    if os.path.exists(journal):  # everything in the journal is now in experiment.yaml
+        os.remove(journal)
+
+
 class Monty:
     """Library for saving and loading data quickly."""
     
-    def __init__(self, identifier: str, experiment={}):
-        """Create new experiment."""
+    def __init__(self, identifier: str, experiment={}, dataformat="xz", codec="lzma", asynchronous=False,
+                 catalogue=True, dedup=False, wal=False, cache=None, summaries=False, pyramid=False):
+        """
+        Create new experiment.
+
+        dataformat= "xz" (default) to pickle the data into a single LZMA file, or "mty" to store every key of data
+                    as its own chunked block that can be loaded on its own or lazily (see container.py)
+        codec= compression as "name[:level][+shuffle]" e.g. "lzma", "lzma:1", "zlib:6+shuffle", "bz2", "none".
+               See compression.py. The "xz" format only supports LZMA presets. Arrays saved in the "mty" format
+               with "none" can be memory mapped
+        asynchronous= compress and write files on a background thread. save() and snapshot() return straight away
+                      and any errors are raised on the next call. Use flush() to wait for the writes to finish
+        catalogue= keep the DATA_DIR catalogue (catalogue.sqlite) up to date with this experiment's runs
+        dedup= store array chunks in the shared chunk store (DATA_DIR/.store) so identical chunks of snapshots and
+               re-saves are only stored once. Only for the "mty" format. See store.py
+        wal= record every write in a write-ahead log (.monty.wal) so writes interrupted by a crash are finished or
+             rolled back automatically the next time the experiment is opened. Files are always written to a
+             temporary file and renamed into place so a crash never leaves a truncated file. See fileio.py
+        cache= serve loads from the read-through cache (read only arrays, see cache.py). None uses the cache if
+               cache.enable() has been called
+        summaries= compute the min, max, mean, NaN count and a small preview of every array when a run is saved and
+                   keep them with the run in experiment.yaml and the catalogue (see summary.py and summary())
+        pyramid= also store the mean/min/max decimation levels of 2D arrays so loadrun(level=k) can read a lower
+                 resolution straight from the file. Only for the "mty" format. See pyramid.py
+        """
+        if dataformat not in FORMATS:
+            raise ValueError(f"ERROR: Unknown data format '{dataformat}'. Must be one of {FORMATS}")
+        if dataformat == "xz" and compression.parse(codec)[0] != "lzma":
+            raise ValueError(f"ERROR: The xz format only supports lzma codecs. Use dataformat='mty' for '{codec}'")
+        if dedup and dataformat != "mty":
+            raise ValueError("ERROR: Deduplication is only supported by the 'mty' format")
+        if pyramid and dataformat != "mty":
+            raise ValueError("ERROR: Pyramids are only supported by the 'mty' format")
         # Experiment values
         self.identifier = identifier.replace(" ", "_")  # experiment directory
         self.root = os.path.join(DATA_DIR, self.identifier.replace(".", "/"))  # Root path of experiment
         os.makedirs(self.root, exist_ok=True)  # create dir if not exists
 
         self.experiment = experiment  # general experiment description
+        self.dataformat = dataformat
+        self.codec = codec
+        self.writer = BackgroundWriter() if asynchronous else None
+        self.store = ChunkStore(os.path.join(DATA_DIR, STORE_DIR)) if dedup else None
+        self.wal = WriteAheadLog(self.root) if wal else None
+        self.cache = cache
+        self.summaries = summaries
+        self.pyramid = pyramid
+        self._queued = set()  # paths waiting to be written by the background writer
+        self._allocated = {}  # (name, extension) -> next repeat number to try (see _allocate_filename)
+        self._changed = set()  # runs saved by this process. Other runs are taken from disk when merging
+        self.lock = FileLock(os.path.join(self.root, LOCK_FNAME))  # shared with other processes using the experiment
+        self._journal_entries = 0  # runs appended to experiment.journal since experiment.yaml was written
         self.data = {}
         self.runs = {}  # indexed by runname
         self.run_map = []  # indexed by runid to return run name
@@ -55,6 +247,8 @@ class Monty:
         self.isrunrunning = False
         self.figures = []  # fnames of figures
         self.datafiles = []  # fnames of compressed data files
+        self._summary = {}  # array summaries of the current run (if summaries)
+        self.stream = None  # open StreamWriter of the current run
         self.runid = 0
         self.runname = ""
         self.start_time = datetime.min  # stand in
@@ -76,7 +270,20 @@ class Monty:
         logger_file.addHandler(file_handler)
         self.logger = logger_std
         self.flogger = logger_file
+
+        self.catalogue = None
+        if catalogue:
+            try:
+                self.catalogue = Catalogue(DATA_DIR)
+            except sqlite3.Error as err:
+                self.logger.warning(f"WARNING: Could not open the catalogue ({err}). Runs will not be indexed.")
         
+        if self.wal is not None:
+            with self.lock:
+                actions = self.wal.recover()
+            for action in actions:
+                self.logger.warning(f"WARNING: Recovered from an interrupted write: {action}")
+
         # Attempt to load the experiment if it already exists
         if os.path.exists(os.path.join(DATA_DIR, identifier.replace(".", "/").replace(" ", "_"), "experiment.yaml")):
             self.logger.info("Loading existing experiment (ignoring given experiment parameters)")
@@ -99,58 +306,192 @@ class Monty:
             rep += f"Began run {self.start_time}\n"
         if len(self.runs) > 0:
             rep += "Runs = " + str(self.runs.keys()) + "\n"
+        for runname, run in self.runs.items():
+            if run.get("summary"):
+                rep += f"{runname}:\n  " + summary.describe(run["summary"]).replace("\n", "\n  ") + "\n"
         return rep
 
+    def _submit(self, func, *args):
+        """Run func now or queue it on the background writer. Arguments must not be modified afterwards."""
+        if self.writer is None:
+            func(*args)
+        else:
+            self.writer.submit(func, *args)
+
+    def flush(self):
+        """Wait for all background writes to finish. Raises any error that occurred while writing."""
+        if self.writer is not None:
+            self.writer.flush()
+            self._queued.clear()
+
     def _save_data(self, path, fname):
         """Save numpy data internally method."""
-        with lzma.open(path, "w") as fz:
-            pickle.dump({
-                "runname": self.runname,
-                "data": self.data,
-                "version": VERSION,
-                "info": self.parameters
-                }, fz, 4)
-        # DO NOT USE PROTOCOL 5. There is a bug with large numpy arrays
-        # See https://github.com/lucianopaz/compress_pickle/issues/23
-
-    def _save_experiment(self):
-        """Save the experiment as a yaml file."""
+        meta = {
+            "runname": self.runname,
+            "version": VERSION,
+            "info": self.parameters
+            }
+        if self.writer is not None:  # give the writer its own copy so we can keep measuring into the arrays
+            meta, data = copy.deepcopy(meta), copy.deepcopy(self.data)
+        else:
+            data = self.data
+        self._submit(self._write_data, path, data, meta)
+
+    def _write_data(self, path, data, meta):
+        """Write the data to disk in the configured format."""
+        try:
+            if self.dataformat == "mty":
+                container.save(path, data, meta, self.codec, self.store, self.wal, self.pyramid)
+                return
+            with atomic_write(path, "wb", self.wal) as f, compression.open_pickle(f, "w", self.codec) as fz:
+                pickle.dump({
+                    "runname": meta["runname"],
+                    "data": {k: np.asarray(v) if isinstance(v, LazyArray) else v for k, v in data.items()},
+                    "version": meta["version"],
+                    "info": meta["info"]
+                    }, fz, 4)
+            # DO NOT USE PROTOCOL 5. There is a bug with large numpy arrays
+            # See https://github.com/lucianopaz/compress_pickle/issues/23
+        except BaseException:
+            if os.path.exists(path) and os.path.getsize(path) == 0:  # give back the name reserved for it
+                os.remove(path)
+            raise
+
+    def _save_experiment(self, runname: str = None):
+        """
+        Save the experiment metadata.
+
+        Only the given (changed) run is appended to the journal so the cost doesn't depend on the number of runs.
+        The full experiment.yaml is only written when it doesn't exist yet or the journal is compacted.
+        """
         path = os.path.join(self.root, "experiment.yaml")
-        with open(path, 'w') as yf:
-            yf.write(f"# << This file is machine generated. Last updated {datetime.now().isoformat()}. Do not edit directly. >>\n")
-            yf.write(yaml.safe_dump({
-                    "identifier": self.identifier,
-                    "experiment": self.experiment,
-                    "version": VERSION,
-                    "runs": self.run_map,
-                }))
-            yf.write("\n")
-            for run in self.runs.keys():
-                yf.write(yaml.safe_dump({
-                    run: self.runs[run]
-                }))
-                yf.write("\n")
-
-    def _find_unused_filename(self, path: str, extension: str):
-        """Return a filename that is currently not being used. Extension is the filetype."""
-        newpath = path
+        if os.path.exists(path) or path in self._queued:
+            if runname is None or runname not in self.runs:
+                return  # nothing has changed
+            if self._journal_entries + 1 < COMPACT_EVERY:
+                run = copy.deepcopy(self.runs[runname]) if self.writer is not None else self.runs[runname]
+                self._submit(self._write_journal, runname, run)
+                self._journal_entries += 1
+                return
+        self.compact()
+
+    def compact(self):
+        """Write the full experiment.yaml (merged with the runs saved by other processes) and clear the journal."""
+        header = {
+            "identifier": self.identifier,
+            "experiment": self.experiment,
+            "version": VERSION,
+            "runs": self.run_map,
+        }
+        runs = self.runs
+        if self.writer is not None:
+            header, runs = copy.deepcopy(header), copy.deepcopy(runs)
+            self._queued.add(os.path.join(self.root, "experiment.yaml"))
+        self._submit(self._write_experiment, header, runs, set(self._changed))
+        self._journal_entries = 0
+
+    def _write_experiment(self, header: dict, runs: dict, changed: set = ()):
+        """
+        Write the experiment yaml file.
+
+        Runs (and the run order) saved by other processes since this one loaded the experiment are kept. For runs
+        that have been saved by both, the runs in changed (saved by this process) win.
+        """
+        with self.lock:
+            if os.path.exists(os.path.join(self.root, "experiment.yaml")):
+                disk, _ = read_experiment(self.root)
+                run_map = disk.get("runs", [])
+                header["runs"] = run_map + [run for run in header["runs"] if run not in run_map]
+                merged = {key: value for key, value in disk.items() if key not in RESERVED_KEYWORDS}
+                merged.update({key: value for key, value in runs.items() if key in changed or key not in merged})
+                runs = merged
+            write_experiment(self.root, header, runs, self.wal)
+
+    def _write_journal(self, runname: str, run: dict):
+        """Append an updated run to the journal."""
+        path = os.path.join(self.root, "experiment.journal")
+        with self.lock:
+            torn = False
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                with open(path, "rb") as f:
+                    f.seek(max(0, os.path.getsize(path) - len(_END)))
+                    torn = not f.read().endswith(_END.encode())
+            with append(path, "ab", self.wal) as yf:  # binary so the entries end in "\n" on Windows too
+                if torn:  # end the torn entry so it can't run into this one
+                    yf.write(_END.encode())
+                yf.write(yaml.dump({runname: run}, Dumper=YamlDumper, explicit_start=True, explicit_end=True,
+                                   encoding="utf-8"))
+
+    def _refresh(self):
+        """Merge in the runs that other processes have started or saved in the experiment. Call with the lock held."""
+        if not os.path.exists(os.path.join(self.root, "experiment.yaml")):
+            return
+        experiment, self._journal_entries = read_experiment(self.root)
+        for run in experiment.get("runs", []):
+            if run not in self.run_map:
+                self.run_map.append(run)
+        for key, run in experiment.items():
+            if key not in RESERVED_KEYWORDS and key not in self._changed:
+                self.runs[key] = run
+                self.runid = max(self.runid, run["runid"])
+
+    def _allocate_filename(self, path: str, extension: str):
+        """
+        Reserve a filename that is not being used (path[.repeat].extension). Returns the path and repeat.
+
+        The next repeat of every name is tracked (starting after the files already listed in the experiment) so
+        normally the first name tried is free. Names are reserved by creating the (empty) file exclusively, which
+        the save then replaces, so two processes saving into the same experiment never get the same name.
+        """
+        key = (os.path.basename(path), extension)
+        if key not in self._allocated:
+            self._allocated[key] = self._next_repeat(*key)
+        while True:
+            repeat = self._allocated[key]
+            self._allocated[key] += 1
+            newpath = path + (("." + str(repeat)) if repeat > 0 else "") + "." + extension
+            try:
+                with open(newpath, "x"):
+                    return newpath, repeat
+            except FileExistsError:  # saved by someone else (or not listed in the experiment)
+                continue
+
+    def _next_repeat(self, name: str, extension: str) -> int:
+        """First repeat after every file of this name in the experiment's datafiles and figures."""
+        fnames = set(self.datafiles + self.figures)
+        for run in self.runs.values():
+            fnames.update(run.get("datafiles", []) + run.get("figures", []))
         repeat = 0
-        while os.path.exists(newpath + "." + extension):  # Check if an existing file exists
-            repeat += 1
-            newpath = path + "." + str(repeat)
-        return newpath + "." + extension, repeat
+        for fname in fnames:
+            if not fname.startswith(name + ".") or not fname.endswith("." + extension):
+                continue
+            middle = fname[len(name) + 1:-len(extension) - 1]
+            if fname == name + "." + extension:
+                repeat = max(repeat, 1)
+            elif middle.isdigit():
+                repeat = max(repeat, int(middle) + 1)
+        return repeat
 
     def save(self, data=None):
         """Save the experiment. Will not overwrite existing files."""
+        if self.writer is not None:  # report a failed background save before this run is finished
+            self.writer.check()
         if data is not None:
             self.data = data
-        self.finishrun()
-        self.logger.info(f"Saving to {self.runname}.xz")
-        path, repeat = self._find_unused_filename(os.path.join(self.root, self.runname), "xz")
-        self.datafiles.append(self.runname + (("." + str(repeat)) if repeat > 0 else "") + ".xz")
+        elif self.stream is not None:  # reassemble from the log. Arrays are only read chunk by chunk when saving
+            self.flush()
+            self.stream.close()
+            self.data = stream.load(self.stream.path)["data"]
+        if self.summaries:
+            self._summary = summary.summarise(self.data)
+        # name the datafile first so the run is indexed in the catalogue with it
+        path, repeat = self._allocate_filename(os.path.join(self.root, self.runname), self.dataformat)
+        self.datafiles.append(self.runname + (("." + str(repeat)) if repeat > 0 else "") + "." + self.dataformat)
+        self._finishrun()  # the run is saved to experiment.yaml once its data has been written
+        self.logger.info(f"Saving to {self.runname}.{self.dataformat}")
         self._save_data(path, self.runname)
         self.logger.info("Saving to experiment.yaml")
-        self._save_experiment()
+        self._save_experiment(self.runname)
 
     def snapshot(self, data=None):
         """
@@ -163,19 +504,67 @@ class Monty:
             return
         if data is not None:
             self.data = data
-        path = os.path.join(self.root, self.runname + "_SNAPSHOT.xz")  # we overwrite the old snapshot if it exists
-        if self.runname + "_SNAPSHOT.xz" not in self.datafiles:
-            self.datafiles.append(self.runname + "_SNAPSHOT.xz")  # we overwrite the file so only add it once
+        if self.stream is not None:  # only write what has changed
+            self.stream.update(self.data)
+            return
+        fname = self.runname + "_SNAPSHOT." + self.dataformat
+        path = os.path.join(self.root, fname)  # we overwrite the old snapshot if it exists
+        listed = fname in self.datafiles
+        if not listed:
+            self.datafiles.append(fname)  # we overwrite the file so only add it once
         self._save_data(path, self.runname + "_SNAPSHOT")
-        self._save_experiment()
+        if not listed:  # later snapshots don't change the run
+            self._save_experiment(self.runname)
+
+    def openstream(self, checkpoint_interval: float = 10.0):
+        """
+        Stream the data of the current run to an append only log (runname_STREAM.log).
+
+        While the stream is open snapshot() only writes the rows that have changed and append() writes single rows.
+        save() without any data reassembles the final arrays from the log.
+
+        checkpoint_interval= seconds between forcing the log onto the disk
+        """
+        if not self.isrunrunning:
+            raise ValueError("ERROR: Cannot open a stream without a current run being active.")
+        if self.stream is not None:
+            self.closestream()
+        fname = self.runname + "_STREAM." + STREAM_EXT
+        self.stream = stream.StreamWriter(os.path.join(self.root, fname), {
+            "runname": self.runname,
+            "version": VERSION,
+            "info": self.parameters
+            }, checkpoint_interval)
+        if fname not in self.datafiles:
+            self.datafiles.append(fname)
+            self._save_experiment(self.runname)
+        self.logger.info(f"Streaming to {fname}")
+
+    def append(self, data: dict, index: int = None):
+        """
+        Append one row (or point) of each array to the open stream.
+
+        index= row of the full array that the data belongs to. Defaults to the next row.
+        """
+        if self.stream is None:
+            raise ValueError("ERROR: No stream is open. Call openstream() first.")
+        self.stream.append(data, index)
+
+    def closestream(self):
+        """Close the stream of the current run."""
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
 
     def savefig(self, plt, desc: str, dpi=1000):
         """Save the given plot as a png."""
         fname = self.runname + "_" + desc.replace(" ", "_")
-        path, repeat = self._find_unused_filename(os.path.join(self.root, fname), "png")
+        path, repeat = self._allocate_filename(os.path.join(self.root, fname), "png")
         self.figures.append(fname + (("." + str(repeat)) if repeat > 0 else "") + ".png")
-        plt.savefig(path, bbox_inches="tight", dpi=dpi)
-        self._save_experiment()
+        with atomic_write(path, "wb", self.wal) as f:
+            plt.savefig(f, format="png", bbox_inches="tight", dpi=dpi)
+        self._save_experiment(self.runname)
+        self._index_run(self.runs.get(self.runname, self._runinfo(None)))
 
     def newrun(self, name: str, parameters: dict):
         """Create a new run for the experiment."""
@@ -184,58 +573,140 @@ class Monty:
             self.flogger.warning("WARNING: Finishing existing run to start a new one")
             self.finishrun()
 
-        name_adj = name  # adjust with numbers for repeating runs
-        i = 1
-        while name_adj in self.runs.keys() or name_adj in RESERVED_KEYWORDS:
-            name_adj = name + "." + str(i)
-            i += 1
-            
-        self.isrunrunning = True
-        self.runid += 1
-        self.runname = name_adj
-        self.start_time = datetime.now()
-        self.parameters = parameters
-        self.figures = []
-        self.datafiles = []
+        # Reserve the name and runid while holding the lock: pick up the runs other processes have started or saved
+        # and write the started run before anyone else can pick the same name
+        with self.lock:
+            self._refresh()
+            name_adj = name  # adjust with numbers for repeating runs
+            i = 1
+            while name_adj in self.runs.keys() or name_adj in RESERVED_KEYWORDS:
+                name_adj = name + "." + str(i)
+                i += 1
+
+            self.isrunrunning = True
+            self.runid += 1
+            self.runname = name_adj
+            self.start_time = datetime.now()
+            self.parameters = parameters
+            self.figures = []
+            self.datafiles = []
+            self._summary = {}
+            self._reserve()
         self.logger.info(f"Started new run {self.runname}")
         self.flogger.info(f"Run {self.identifier + '.' + self.runname} started")
-        self._save_experiment()
+        self._index_run(self._runinfo(None), experiment=True)
 
-    def finishrun(self):
-        """Add the finished run to the list of runs."""
-        self.isrunrunning = False
-        if self.runname in self.runs.keys():
-            self.logger.warning(f"WARNING: Overwriting run {self.runname}")
-        self.runs[self.runname] = {
+    def _reserve(self):
+        """Write the started run to the experiment straight away (not on the background writer). Hold the lock."""
+        self.runs[self.runname] = self._runinfo(None)
+        self._changed.add(self.runname)
+        if self.runname not in self.run_map:
+            self.run_map.append(self.runname)
+        if os.path.exists(os.path.join(self.root, "experiment.yaml")):
+            self._write_journal(self.runname, self.runs[self.runname])
+            self._journal_entries += 1
+            return
+        self._write_experiment({
+            "identifier": self.identifier,
+            "experiment": self.experiment,
+            "version": VERSION,
+            "runs": list(self.run_map),
+        }, copy.deepcopy(self.runs), set(self._changed))
+
+    def _runinfo(self, time_end):
+        """The current run as it is saved in experiment.yaml."""
+        run = {
             "runid": self.runid,
             "time_start": str(self.start_time),
-            "time_end": str(datetime.now()),
+            "time_end": time_end,
             "parameters": self.parameters,
             "figures": self.figures,
             "datafiles": self.datafiles,
         }
+        if self._summary:
+            run["summary"] = self._summary
+        return run
+
+    def _index_run(self, run: dict, experiment: bool = False):
+        """Update the catalogue with the current run. The catalogue is only an index so never fail because of it."""
+        if self.catalogue is None:
+            return
+        try:
+            if experiment:
+                self.catalogue.update_experiment(self.identifier, self.experiment, VERSION)
+            self.catalogue.update_run(self.identifier, self.runname, run)
+        except sqlite3.Error as err:
+            self.logger.warning(f"WARNING: Could not update the catalogue: {err}")
+
+    def finishrun(self):
+        """Add the finished run to the list of runs and save it to the experiment."""
+        self._finishrun()
+        self._save_experiment(self.runname)
+
+    def _finishrun(self):
+        """Add the finished run to the list of runs."""
+        self.closestream()
+        self.isrunrunning = False
+        if self.runs.get(self.runname, {}).get("time_end") is not None:  # started runs are reserved by newrun
+            self.logger.warning(f"WARNING: Overwriting run {self.runname}")
+        self.runs[self.runname] = self._runinfo(str(datetime.now()))
+        self._changed.add(self.runname)
         if self.runname not in self.run_map:  # dont add duplicates when rerunning runs
             self.run_map.append(self.runname)
+        self._index_run(self.runs[self.runname])
         self.flogger.info(f"Run {self.identifier + '.' + self.runname} ended")
         self.logger.info(f"Run finished and took {str(datetime.now() - self.start_time)}.")
 
-    def loadrun(self, runname: str):
-        """Load specific run of data."""
-        runname = runname.replace(" ", "_")
-        if runname not in self.runs.keys():
-            raise ValueError(f"ERROR: Unknown run '{runname}'.")
-        path = os.path.join(self.root, runname + ".xz")
+    def _datapath(self, fname: str):
+        """Return the path of an existing data file. If no extension is given try each of the data formats."""
+        if fname.endswith(tuple("." + ext for ext in FORMATS + [STREAM_EXT])):
+            return os.path.join(self.root, fname)
+        for ext in FORMATS:
+            path = os.path.join(self.root, fname + "." + ext)
+            if os.path.exists(path):
+                return path
+        return os.path.join(self.root, fname + "." + self.dataformat)
+
+    def _load_file(self, path: str, lazy: bool = False, keys: list = None, level: int = 0, stat: str = "mean"):
+        """Load a data file of any format. Returns the saved dict (runname, data, version, info)."""
+        self.flush()  # make sure we aren't reading a file that is still being written
         if not os.path.exists(path):
             raise OSError(f"ERROR: File doesn't exist '{path}'")
         self.logger.info(f"Loading '{path}'")
-        with lzma.open(path, "r") as fz:
-            data = pickle.load(fz)
-            if data["version"] != VERSION:
-                self.logger.warning("WARNING: Saved object does not match current Monty version")
-            if data["runname"] != runname:
-                print(f'{data["runname"]}')
-                self.logger.warning(f"WARNING: File runname ({data['runname']}) does not match requested run name {runname}")
-            self.data = data["data"]
+        if self.cache or (self.cache is None and cache.ENABLED):
+            data = cache.load(path, keys, level, stat)
+        else:
+            data = loadfile(path, lazy, keys, level, stat)
+        if data["version"] != VERSION:
+            self.logger.warning("WARNING: Saved object does not match current Monty version")
+        return data
+
+    def summary(self, runname: str) -> dict:
+        """Array summaries of a run ({key: {shape, dtype, min, max, mean, nan, preview}}) without loading it."""
+        runname = runname.replace(" ", "_")
+        if runname not in self.runs.keys():
+            raise ValueError(f"ERROR: Unknown run '{runname}'.")
+        return self.runs[runname].get("summary", {})
+
+    def loadrun(self, runname: str, lazy: bool = False, keys: list = None, level: int = 0, stat: str = "mean"):
+        """
+        Load specific run of data.
+
+        lazy= If the run was saved as a container return memory mapped/lazily decompressed arrays (read only and
+              only partly numpy compatible) instead of numpy arrays.
+        keys= only load these keys of data (e.g. ["R"]). Only the requested blocks are read from "mty" files.
+        level= return 2D maps reduced over 2^level x 2^level blocks for quick plots (level 1 of a 1001x1001 map is
+               501x501). Read directly from runs saved with pyramid=True, otherwise computed from the full map
+        stat= "mean", "min" or "max" of each block (see pyramid.py)
+        """
+        runname = runname.replace(" ", "_")
+        if runname not in self.runs.keys():
+            raise ValueError(f"ERROR: Unknown run '{runname}'.")
+        data = self._load_file(self._datapath(runname), lazy, keys, level, stat)
+        if data["runname"] != runname:
+            print(f'{data["runname"]}')
+            self.logger.warning(f"WARNING: File runname ({data['runname']}) does not match requested run name {runname}")
+        self.data = data["data"]
         # Configure internal variables to point to loaded data
         self.runname = data["runname"]
         try:
@@ -244,6 +715,49 @@ class Monty:
             self.logger.warning("Loaded run is not found in experiment parameter list.")
         return self.data
 
+    def _saved_runs(self) -> list:
+        """Runs with data files in the order they were taken (runs that have only been started have none)."""
+        return [run for run in self.run_map if run in self.runs and self.runs[run].get("datafiles")]
+
+    def loadruns(self, runnames: list = None, workers: int = None, maxpending: int = None, progress: bool = True,
+                 keys: list = None):
+        """
+        Load many runs in parallel (see bulk.py). Generator of (runname, data) in the order they finish loading.
+
+        Unlike loadrun() this doesn't change the current run.
+
+        runnames= runs to load. Defaults to every run with saved data
+        workers= number of worker processes
+        maxpending= maximum number of runs held in memory that haven't been yielded yet
+        keys= only load these keys of data
+        """
+        runnames = self._saved_runs() if runnames is None else runnames
+        runnames = [runname.replace(" ", "_") for runname in runnames]
+        for runname in runnames:
+            if runname not in self.runs.keys():
+                raise ValueError(f"ERROR: Unknown run '{runname}'.")
+        self.flush()
+        paths = {self._datapath(runname): runname for runname in runnames}
+        for path, data in bulk.loadmany(paths, workers, maxpending, progress=progress, keys=keys):
+            if data["version"] != VERSION:
+                self.logger.warning(f"WARNING: Saved object '{path}' does not match current Monty version")
+            yield paths[path], data["data"]
+
+    def collection(self, runs: list = None, match=None, maxbytes: int = 1 << 30):
+        """
+        Return a lazy collection over the runs of this experiment (see collection.py).
+
+        runs= list of run names. Defaults to every run with saved data in the order they were taken
+        match= only include runs whose name starts with this string, or for which match(runname, run) is True
+        maxbytes= maximum size of the arrays kept in memory
+        """
+        runs = self._saved_runs() if runs is None else runs
+        if isinstance(match, str):
+            runs = [run for run in runs if run.startswith(match.replace(" ", "_"))]
+        elif match is not None:
+            runs = [run for run in runs if match(run, self.runs[run])]
+        return RunCollection(self, runs, maxbytes)
+
     def loadexperiment(self, identifier: str = None):
         """Load experiment from disk."""
         if identifier is None:
@@ -253,11 +767,12 @@ class Monty:
         if not os.path.exists(path):
             raise OSError(f"ERROR: Could not find experiment '{path}'")
 
-        with open(path, "r") as yf:
-            try:
-                experiment = yaml.safe_load(yf)
-            except yaml.YAMLError as err:
-                raise OSError(f"ERROR: Could not load experiment: '{err}'")
+        root = os.path.dirname(path)
+        try:
+            with self.lock if root == self.root else FileLock(os.path.join(root, LOCK_FNAME)):
+                experiment, self._journal_entries = read_experiment(root)
+        except yaml.YAMLError as err:
+            raise OSError(f"ERROR: Could not load experiment: '{err}'")
 
         # set values from experiment
         if experiment["version"] != VERSION:
@@ -272,6 +787,8 @@ class Monty:
         
         runid = 0
         self.runs = {}
+        self._allocated = {}
+        self._changed = set()
         for key in experiment.keys():
             if key not in RESERVED_KEYWORDS:
                 self.runs[key] = experiment[key]
@@ -282,23 +799,11 @@ class Monty:
         self.logger.info(f"Next run will have id {self.runid}")
         return self
     
-    def loaddata(self, fname: str):
-        """Load a raw data file. Usually this is a SNAPSHOT file that didn't save properly"""
-        if not fname.endswith(".xz"):
-            fname += ".xz"
-        path = os.path.join(self.root, fname)
-        if not os.path.exists(path):
-            raise OSError(f"ERROR: File doesn't exist '{path}'")
-        self.logger.info(f"Loading '{path}'")
-        with lzma.open(path, "r") as fz:
-            data = pickle.load(fz)
-            if data["version"] != VERSION:
-                self.logger.warning("WARNING: Saved object does not match current Monty version")
-            self.data = data["data"]
-            self.parameters = data["info"]
-            self.runname = data["runname"]
-            self.logger.info(f"Loaded data with run name {data['runname']}")
+    def loaddata(self, fname: str, lazy: bool = False, keys: list = None, level: int = 0, stat: str = "mean"):
+        """Load a raw data file. Usually this is a SNAPSHOT file that didn't save properly. See loadrun"""
+        data = self._load_file(self._datapath(fname), lazy, keys, level, stat)
+        self.data = data["data"]
+        self.parameters = data["info"]
+        self.runname = data["runname"]
+        self.logger.info(f"Loaded data with run name {data['runname']}")
         return self.data
-
-        
-
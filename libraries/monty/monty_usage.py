@@ -45,8 +45,117 @@ m.save({
 
 #m.savefig(plt)
 
+#%% Stream a long sweep to disk. Each snapshot only writes the rows that changed
+
+m.newrun("streamed", {"desc": "Snapshots only append the new rows"})
+m.openstream()
+
+data = np.zeros((100, 100))
+for i in range(100):
+    data[i, :] = np.random.rand(100)
+    m.snapshot({"data": data})
+
+m.save()  # reassembled from the stream log
+
 #%%
 
 m.loadexperiment("SET.ST_sweep")
 
 m.loadrun("another")
+
+
+#%% The catalogue lists the datafile of a run straight after a plain save
+
+m.newrun("catalogued", {"desc": "Check the catalogue entry"})
+m.save({"data": np.random.rand(10)})
+runs = [run for run in m.catalogue.find(identifier=m.identifier, runname=m.runname) if run["runname"] == m.runname]
+assert runs and runs[0]["datafiles"] == [m.runname + "." + m.dataformat], runs
+
+
+#%% Runs that are never saved are still listed with their snapshot, stream log and end time
+
+m.newrun("aborted_snapshot", {})
+m.snapshot({"data": np.random.rand(10)})
+snapshotted = m.runname
+m.newrun("aborted_stream", {})
+m.openstream()
+m.append({"data": np.random.rand(10)})
+streamed = m.runname
+m.newrun("after_abort", {})
+runs = Monty(m.identifier).runs
+assert runs[snapshotted]["datafiles"] == [snapshotted + "_SNAPSHOT." + m.dataformat], runs[snapshotted]
+assert runs[streamed]["datafiles"] == [streamed + "_STREAM.log"], runs[streamed]
+assert runs[snapshotted]["time_end"] is not None and runs[streamed]["time_end"] is not None
+m.save({"data": "finished"})
+
+
+#%% Arrays loaded from a compressed .mty file can be written to, nested ones included
+
+c = Monty(m.identifier, dataformat="mty", codec="lzma")
+c.newrun("writable", {})
+c.save({"x": {"y": np.arange(5.0)}})
+loaded = c.loaddata(c.runname)["x"]["y"]
+loaded[0] = 1
+assert loaded[0] == 1
+
+
+#%% A failed background save is reported by the next save before that run is finished
+
+import threading
+import time
+
+a = Monty(m.identifier, asynchronous=True)
+gate = threading.Event()
+def fail(*args):
+    gate.wait()
+    raise OSError("disk full")
+a._write_data = fail
+a.newrun("failed_write", {})
+a.save({"data": np.random.rand(10)})
+gate.set()
+time.sleep(0.5)  # let the write fail
+del a._write_data
+a.newrun("after_failed_write", {})
+try:
+    a.save({"data": np.random.rand(10)})
+    raise AssertionError("the failed write was not reported")
+except OSError:
+    assert a.isrunrunning
+a.save({"data": np.random.rand(10)})
+a.flush()
+assert a.runname in Monty(m.identifier).runs
+
+
+#%% Migrating only converts experiments. Monty 1.1 archives next to them are left for monty11.py
+
+import os
+import shutil
+import tempfile
+from monty import migrate, monty11
+
+root = tempfile.mkdtemp()
+source = Monty("SET.migrate_source", dataformat="xz")
+source.newrun("to_migrate", {})
+source.save({"I": np.random.rand(10)})
+shutil.copytree(source.root, os.path.join(root, "SET", "migrated"))
+monty11.Monty("legacy", {}, {"I": np.random.rand(10)})._save(os.path.join(root, "legacy.xz"))
+migrate.migrate(root, workers=1, delete=True)
+assert sorted(os.listdir(root)) == ["SET", "legacy.xz"]
+assert not any(fname.endswith(".xz") for fname in os.listdir(os.path.join(root, "SET", "migrated")))
+
+
+#%% Round trip through a QCoDeS database (needs qcodes). Imported runs export again with the same setpoints
+
+import os
+import tempfile
+from monty import bridge
+
+db = os.path.join(tempfile.mkdtemp(), "roundtrip.db")
+R = np.random.rand(5, 3)
+m.newrun("qcodes_map", {"ST": "range from 1v -> 2v, over 5 pts", "P1": "range from 0v -> 1v, over 3 pts"})
+m.save({"R": R, "note": "exported to qcodes"})
+imported = Monty("SET.qcodes_roundtrip")
+names = bridge.from_qcodes(list(bridge.to_qcodes(m, [m.runname], db=db).values()), imported, db=db)
+names = bridge.from_qcodes(list(bridge.to_qcodes(imported, list(names.values()), db=db).values()), imported, db=db)
+data = imported.loadrun(list(names.values())[0])
+assert np.allclose(data["R"], R) and np.allclose(data["ST"], np.linspace(1, 2, 5)) and data["note"] == m.data["note"]
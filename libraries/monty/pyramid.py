@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:00 2026
+
+Decimation pyramids of 2D maps for quick overview plots.
+
+Level k of a 2D array is the array reduced over blocks of 2^k x 2^k points (the blocks at the bottom and right
+edges may be smaller):
+
+    mean    mean of the finite values in the block (NaN if there are none)
+    min     smallest value in the block (NaNs are ignored)
+    max     largest value in the block
+
+Levels stop once neither axis is longer than MINSIZE, so a 1001x1001 map has levels of 501, 251, 126 and 63 points
+per side. Complex arrays only have a mean. Each level is computed from the one below it (keeping the sums and
+number of finite values for the mean) so saved levels and levels computed when loading are identical.
+
+Monty(dataformat="mty", pyramid=True) stores the levels in the container with the array (see container.py). Load
+them with monty.loadrun(runname, level=k, stat="max"). Files without them are reduced when loaded.
+
+@author: james
+"""
+
+import numpy as np
+
+
+MINSIZE = 64
+STATS = ["mean", "min", "max"]
+
+
+def haslevels(arr) -> bool:
+    """If an array gets a pyramid (numeric 2D arrays bigger than MINSIZE)."""
+    return arr.ndim == 2 and arr.dtype.kind in "biufc" and max(arr.shape) > MINSIZE
+
+
+def nlevels(shape: tuple) -> int:
+    """Number of levels above the full array."""
+    n = 0
+    h, w = shape
+    while max(h, w) > MINSIZE:
+        h, w = (h + 1) // 2, (w + 1) // 2
+        n += 1
+    return n
+
+
+def _blocks(x: np.ndarray, mode: str) -> np.ndarray:
+    """View x as 2x2 blocks (h/2, 2, w/2, 2), padding odd axes."""
+    h, w = x.shape
+    if h % 2 or w % 2:
+        pad = ((0, h % 2), (0, w % 2))
+        x = np.pad(x, pad, mode="constant") if mode == "zero" else np.pad(x, pad, mode="edge")
+    return x.reshape(x.shape[0] // 2, 2, x.shape[1] // 2, 2)
+
+
+def levels(arr, n: int = None):
+    """
+    Generator of the levels of a 2D array as {"mean": ..., "min": ..., "max": ...} (complex: only "mean").
+
+    n= number of levels (defaults to all of them, see nlevels)
+    """
+    x = np.asarray(arr)
+    n = nlevels(x.shape) if n is None else min(n, nlevels(x.shape))
+    complex_ = x.dtype.kind == "c"
+    dtype = np.result_type(x.dtype, np.float32)  # of the mean. float32 maps stay float32
+    finite = np.isfinite(x)
+    sums = np.where(finite, x, 0).astype(np.complex128 if complex_ else np.float64)
+    counts = finite.astype(np.int64)
+    lo = hi = x
+    for _ in range(n):
+        sums = _blocks(sums, "zero").sum(axis=(1, 3))
+        counts = _blocks(counts, "zero").sum(axis=(1, 3))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            level = {"mean": np.where(counts > 0, sums / np.maximum(counts, 1), np.nan).astype(dtype)}
+        if not complex_:
+            lo = np.fmin.reduce(_blocks(lo, "edge"), axis=(1, 3))
+            hi = np.fmax.reduce(_blocks(hi, "edge"), axis=(1, 3))
+            level.update(min=lo, max=hi)
+        yield level
+
+
+def decimate(arr, level: int, stat: str = "mean"):
+    """
+    Level of an array (the coarsest level if there are fewer). Arrays without levels are returned as they are.
+
+    stat= "mean", "min" or "max". Complex arrays always return the mean
+    """
+    if stat not in STATS:
+        raise ValueError(f"ERROR: Unknown statistic '{stat}'. Must be one of {STATS}")
+    if level <= 0 or not haslevels(arr):
+        return arr
+    result = arr
+    for result in levels(arr, level):
+        pass
+    return result.get(stat, result["mean"])
@@ -7,10 +7,11 @@ Just load a raw data file. Don't process it or anything.
 @author: james
 """
 
-import lzma
 import pickle
 import os
 
+from . import container, stream, compression, pyramid
+
 
 if os.name == "posix":  # mac or linux
     DATA_DIR = "/Users/james/Documents/Backups/honours-quench-data"
@@ -18,10 +19,36 @@ else:  # Windows (Probably LD fridge)
     DATA_DIR = "C:\\Users\\LD2007\\Documents\\Si_CMOS_james\\data"
 
 
-def loadraw(fname: str):
-    """Load a raw .xz file, bypassing monty"""
+def loadfile(path: str, lazy: bool = False, keys: list = None, level: int = 0, stat: str = "mean") -> dict:
+    """
+    Load a data file of any format (container, stream log or compressed pickle) given its full path.
+
+    lazy= return memory mapped/lazily decompressed arrays of containers and logs instead of numpy arrays
+    keys= only load these keys of data. Containers and logs only read the requested keys from disk, pickle
+          files have to be read in full and are then filtered
+    level= reduce 2D arrays over 2^level x 2^level blocks, taking the stat ("mean", "min" or "max") of each block
+           (see pyramid.py). Containers saved with a pyramid read the level directly
+    """
+    if container.iscontainer(path):
+        return container.load(path, lazy, keys, level, stat)
+    if stream.isstream(path):
+        data = stream.load(path, lazy, keys)
+    else:
+        with compression.open_pickle(path) as fz:
+            data = pickle.load(fz)
+        if keys is not None:
+            data["data"] = {key: data["data"][key] for key in container._select(data["data"], keys, path)}
+    if level > 0:
+        data["data"] = {key: pyramid.decimate(value, level, stat) if hasattr(value, "ndim") else value
+                        for key, value in data["data"].items()}
+    return data
+
+
+def loadraw(fname: str, lazy: bool = False, keys: list = None, level: int = 0, stat: str = "mean"):
+    """Load a raw .xz, .mty or .log file, bypassing monty. keys= only load these keys of data. level, stat see loadfile"""
     path = os.path.join(DATA_DIR, fname)
     print(f"Loading {path}")
-    with lzma.open(path, "r") as fz:
-        data = pickle.load(fz)
-    return data
+    from . import cache  # cache imports this module
+    if cache.ENABLED:
+        return cache.load(path, keys, level, stat)
+    return loadfile(path, lazy, keys, level, stat)
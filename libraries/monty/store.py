@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:00 2026
+
+Content addressed chunk store shared by every container in DATA_DIR (DATA_DIR/.store).
+
+Snapshots, final saves and re-saves of a run mostly contain the same arrays. With
+Monty(dataformat="mty", dedup=True) the array chunks of a container are written to the store instead of the
+container itself, named by the sha256 of their (uncompressed) contents and codec (and element size for shuffled
+codecs), so every identical chunk is only compressed and stored once. The container keeps the digests in its block table.
+
+Which containers reference which chunks is kept in refs.sqlite. Chunks are never deleted while a container
+references them; run gc to drop the references of containers that have been deleted (or overwritten) and to
+delete the chunks that are no longer referenced.
+
+Run from libraries/ with
+    python -m monty.store gc [DATA_DIR]
+    python -m monty.store stats [DATA_DIR]
+
+@author: james
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+
+
+DIRNAME = ".store"
+ORPHAN_AGE = 3600  # seconds before an unreferenced chunk file (possibly still being saved) can be deleted
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS refs (
+    path TEXT,
+    digest TEXT,
+    PRIMARY KEY (path, digest)
+);
+CREATE INDEX IF NOT EXISTS refs_digest ON refs (digest);
+"""
+
+
+def digest(buf, codec: str, itemsize: int = 1) -> str:
+    """
+    Name of a chunk. The codec is included so the same data compressed differently is stored separately. Shuffled
+    chunks depend on the element size too so it is included for shuffled codecs (other names are unchanged).
+    """
+    if codec.endswith("+shuffle"):
+        codec += f"/{itemsize}"
+    h = hashlib.sha256(codec.encode())
+    h.update(buf)
+    return h.hexdigest()
+
+
+class ChunkStore:
+    """Directory of chunks named by their digest."""
+
+    def __init__(self, root: str = None):
+        """root= store directory. Defaults to DATA_DIR/.store"""
+        if root is None:
+            from .monty import DATA_DIR
+            root = os.path.join(DATA_DIR, DIRNAME)
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        # saves may run on the background writer thread
+        self.db = sqlite3.connect(os.path.join(root, "refs.sqlite"), timeout=30, check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name[2:])
+
+    def touch(self, name: str) -> bool:
+        """Check if a chunk is stored. If it is, mark it as recently used so gc leaves it alone until the
+        container that is about to reference it has been saved."""
+        try:
+            os.utime(self.path(name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, name: str, buf) -> int:
+        """Store a (compressed) chunk. Returns the number of bytes written."""
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf)
+        os.replace(tmp, path)  # never leave a partial chunk under its final name
+        return memoryview(buf).nbytes
+
+    def read(self, name: str) -> bytes:
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def _key(self, path: str) -> str:
+        """Containers are recorded relative to DATA_DIR so the whole directory can be moved or restored."""
+        return os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(self.root)))
+
+    def reference(self, path: str, names):
+        """Record that the container at path uses these chunks (replacing what it used before)."""
+        path = self._key(path)
+        with self.db:
+            self.db.execute("DELETE FROM refs WHERE path = ?", (path,))
+            self.db.executemany("INSERT OR IGNORE INTO refs VALUES (?, ?)", [(path, name) for name in set(names)])
+
+    def refcount(self, name: str) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM refs WHERE digest = ?", (name,)).fetchone()[0]
+
+    def _files(self):
+        """(name, path) of every chunk file."""
+        for sub in os.listdir(self.root):
+            subdir = os.path.join(self.root, sub)
+            if len(sub) == 2 and os.path.isdir(subdir):
+                for fname in os.listdir(subdir):
+                    yield sub + fname, os.path.join(subdir, fname)
+
+    def stats(self) -> dict:
+        """Number of chunks and containers and the size of the store."""
+        chunks, nbytes = 0, 0
+        for _, path in self._files():
+            chunks += 1
+            nbytes += os.path.getsize(path)
+        containers = self.db.execute("SELECT COUNT(DISTINCT path) FROM refs").fetchone()[0]
+        refs = self.db.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+        return {"chunks": chunks, "bytes": nbytes, "containers": containers, "references": refs}
+
+    def gc(self, progress: bool = True) -> dict:
+        """
+        Delete chunks that aren't referenced by any container.
+
+        References of containers that no longer exist, or that have been overwritten by a file that doesn't use
+        the store, are dropped first. Returns the number of chunks and bytes freed.
+        """
+        from .container import storedigests
+        parent = os.path.dirname(os.path.abspath(self.root))
+        paths = [os.path.join(parent, row[0]) for row in self.db.execute("SELECT DISTINCT path FROM refs")]
+        for path in paths:
+            try:
+                names = storedigests(path)
+            except (OSError, EOFError, ValueError):  # deleted or not a container anymore
+                names = []
+            self.reference(path, names)
+
+        live = {row[0] for row in self.db.execute("SELECT DISTINCT digest FROM refs")}
+        chunks, nbytes = 0, 0
+        now = time.time()
+        for name, path in list(self._files()):
+            if name in live or now - os.path.getmtime(path) < ORPHAN_AGE:
+                continue  # recent chunks may belong to a container that is being saved right now
+            size = os.path.getsize(path)
+            os.remove(path)
+            chunks += 1
+            nbytes += size
+        if progress:
+            print(f"Freed {chunks} chunks ({nbytes / 1e6:.1f} MB)")
+        return {"chunks": chunks, "bytes": nbytes}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("gc", "stats"):
+        print("Usage: python -m monty.store gc|stats [DATA_DIR]")
+        sys.exit(1)
+    store = ChunkStore(os.path.join(sys.argv[2], DIRNAME) if len(sys.argv) > 2 else None)
+    if sys.argv[1] == "gc":
+        store.gc()
+    print(store.stats())
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:30 2026
+
+Append only run log used by Monty to stream data to disk while a measurement is running.
+
+Only rows that are new (or have changed) are written, so the cost of saving is proportional to the amount
+of new data rather than the size of the dataset. Each record is checksummed and every append is terminated
+by a commit record. When reading, a torn record or any records after the last commit are ignored so a crash
+mid-write always leaves the last complete snapshot.
+
+    MAGIC | record | record | ... where record = lengths (RECORD) | header (pickle) | payload
+
+@author: james
+"""
+
+import os
+import pickle
+import struct
+import time
+import zlib
+import numpy as np
+
+from .container import LazyArray, _select
+
+
+MAGIC = b"MONTYLOG"
+RECORD = struct.Struct("<IQI")  # header length, payload length, crc32 of header and payload
+BLOCK = 256  # 1D arrays are compared and written in blocks of this many points
+
+
+def _blocksize(arr: np.ndarray) -> int:
+    """Number of rows (first axis) that are written as one record."""
+    return BLOCK if arr.ndim == 1 else 1
+
+
+class StreamWriter:
+    """Append rows of data to a run log."""
+
+    def __init__(self, path: str, meta: dict, checkpoint_interval: float = 10.0):
+        """
+        Open (or continue) the log at path.
+
+        meta= stored at the start of the log (runname, version, info)
+        checkpoint_interval= seconds between forcing the log to disk (fsync)
+        """
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self._crcs = {}  # key -> list of crc of each written block (to only write changes)
+        self._next = {}  # key -> next row when appending
+        self._last_checkpoint = time.monotonic()
+
+        if os.path.exists(path):
+            index, end = _scan(path)  # drop anything after the last commit (torn writes from a crash)
+            self._next = {key: info["shape"][0] for key, info in index["arrays"].items()}
+            with open(path, "r+b") as f:
+                f.truncate(end)
+            self._f = open(path, "ab")
+        else:
+            self._f = open(path, "wb")
+            self._f.write(MAGIC)
+            self._write({"kind": "meta", "meta": meta})
+            self._commit()
+
+    def _write(self, header: dict, payload=b""):
+        hbuf = pickle.dumps(header, 4)
+        crc = zlib.crc32(payload, zlib.crc32(hbuf))
+        self._f.write(RECORD.pack(len(hbuf), memoryview(payload).nbytes, crc))
+        self._f.write(hbuf)
+        self._f.write(payload)
+
+    def _commit(self):
+        self._write({"kind": "commit"})
+        self._f.flush()
+        if time.monotonic() - self._last_checkpoint > self.checkpoint_interval:
+            self.checkpoint()
+
+    def _write_rows(self, key: str, rows: np.ndarray, start: int, shape: tuple):
+        """Write rows as the rows [start, start + len(rows)) of an array with the given (full) shape."""
+        rows = np.ascontiguousarray(rows)
+        self._write({"kind": "rows", "key": key, "start": start, "stop": start + rows.shape[0],
+                     "shape": shape, "dtype": rows.dtype.str}, memoryview(rows.reshape(-1).view(np.uint8)))
+
+    def checkpoint(self):
+        """Force everything written so far onto the disk."""
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._last_checkpoint = time.monotonic()
+
+    def append(self, data: dict, index: int = None):
+        """
+        Append one row (or point) of each array in data.
+
+        index= row of the full array that this is. Defaults to the row after the last appended one.
+        """
+        for key, value in data.items():
+            if np.asarray(value).dtype.kind not in "biufc":
+                self._write({"kind": "object", "key": key}, pickle.dumps(value, 4))
+                continue
+            value = np.asarray(value)
+            row = index if index is not None else self._next.get(key, 0)
+            self._next[key] = row + 1
+            self._write_rows(key, value[np.newaxis], row, (row + 1,) + value.shape)
+        self._commit()
+
+    def update(self, data: dict):
+        """
+        Write a snapshot of the full data. Only the rows that changed since the last update are written.
+        """
+        for key, value in data.items():
+            if not isinstance(value, np.ndarray) or value.ndim == 0 or value.dtype.kind not in "biufc":
+                buf = pickle.dumps(value, 4)
+                crc = zlib.crc32(buf)
+                if self._crcs.get(key) != crc:
+                    self._write({"kind": "object", "key": key}, buf)
+                    self._crcs[key] = crc
+                continue
+
+            arr = np.ascontiguousarray(value)
+            size = _blocksize(arr)
+            old = self._crcs.get(key)
+            if not isinstance(old, list) or len(old) != -(-arr.shape[0] // size):
+                old = self._crcs[key] = [None] * -(-arr.shape[0] // size)
+            for b, start in enumerate(range(0, arr.shape[0], size)):
+                crc = zlib.crc32(arr[start:start + size])
+                if old[b] != crc:
+                    self._write_rows(key, arr[start:start + size], start, arr.shape)
+                    old[b] = crc
+        self._commit()
+
+    def close(self):
+        """Checkpoint and close the log."""
+        if not self._f.closed:
+            self.checkpoint()
+            self._f.close()
+
+
+def _scan(path: str):
+    """
+    Read the record table of a log.
+
+    Returns (index, end) where index = {"meta": ..., "arrays": {key: info}, "objects": {key: (offset, nbytes)}}
+    and end is the byte position of the end of the last commit.
+    """
+    index = {"meta": {}, "arrays": {}, "objects": {}}
+    pending = []
+    end = len(MAGIC)
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise OSError(f"ERROR: '{path}' is not a Monty run log")
+        size = os.fstat(f.fileno()).st_size
+        while True:
+            lengths = f.read(RECORD.size)
+            if len(lengths) < RECORD.size:
+                break
+            hlen, plen, crc = RECORD.unpack(lengths)
+            if f.tell() + hlen + plen > size:
+                break  # torn write
+            hbuf = f.read(hlen)
+            offset = f.tell()
+            payload = f.read(plen)
+            if zlib.crc32(payload, zlib.crc32(hbuf)) != crc:
+                break  # torn write
+            header = pickle.loads(hbuf)
+            if header["kind"] != "commit":
+                pending.append((header, offset, plen))
+                continue
+
+            for header, offset, plen in pending:  # apply the committed records
+                if header["kind"] == "meta":
+                    index["meta"] = header["meta"]
+                elif header["kind"] == "object":
+                    index["objects"][header["key"]] = (offset, plen)
+                    index["arrays"].pop(header["key"], None)
+                else:
+                    info = index["arrays"].setdefault(header["key"], {"shape": header["shape"], "blocks": []})
+                    if info["blocks"] and (info["dtype"] != header["dtype"]
+                                           or tuple(info["shape"][1:]) != tuple(header["shape"][1:])):  # array was replaced
+                        info["blocks"] = []
+                    info["dtype"] = header["dtype"]
+                    info["shape"] = (max(header["shape"][0], info["shape"][0]),) + tuple(header["shape"][1:])
+                    info["blocks"].append((header["start"], header["stop"], offset))
+                    index["objects"].pop(header["key"], None)
+            pending = []
+            end = f.tell()
+    return index, end
+
+
+class LogArray(LazyArray):
+    """Read only array reassembled from the rows in a run log. Missing rows are zero."""
+
+    def __init__(self, path: str, info: dict):
+        self.path = path
+        self.shape = tuple(info["shape"])
+        self.dtype = np.dtype(info["dtype"])
+        self._blocks = info["blocks"]
+
+    def __repr__(self):
+        return f"LogArray(shape={self.shape}, dtype={self.dtype}, records={len(self._blocks)})"
+
+    def _rows(self, start: int, stop: int) -> np.ndarray:
+        out = np.zeros((max(0, stop - start),) + self.shape[1:], dtype=self.dtype)
+        rowbytes = int(np.prod(self.shape[1:], dtype=int)) * self.dtype.itemsize
+        with open(self.path, "rb") as f:
+            for (lo, hi, offset) in self._blocks:  # later records override earlier ones
+                a, b = max(lo, start), min(hi, stop)
+                if a >= b:
+                    continue
+                f.seek(offset + (a - lo) * rowbytes)
+                f.readinto(memoryview(out[a - start:b - start].reshape(-1).view(np.uint8)))
+        return out
+
+
+def load(path: str, lazy: bool = True, keys: list = None) -> dict:
+    """
+    Reassemble the data in a run log.
+
+    Returns a dict of the same form as the other Monty files ({"data": ..., **meta}).
+    If lazy, arrays are returned as LogArrays which are only read from the log when sliced.
+    keys= only read these keys of data
+    """
+    index, _ = _scan(path)
+    data = {}
+    with open(path, "rb") as f:
+        for key in _select({**index["objects"], **index["arrays"]}, keys, path):
+            if key in index["objects"]:
+                offset, nbytes = index["objects"][key]
+                f.seek(offset)
+                data[key] = pickle.loads(f.read(nbytes))
+            else:
+                arr = LogArray(path, index["arrays"][key])
+                data[key] = arr if lazy else np.asarray(arr)
+    return {**index["meta"], "data": data}
+
+
+def isstream(path: str) -> bool:
+    """Check if the file at path is a run log."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
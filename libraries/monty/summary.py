@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:00 2026
+
+Summaries of the arrays of a run, computed when the run is saved (Monty(summaries=True)).
+
+Each array gets its shape, dtype, min, max, mean, number of NaNs and a small preview (the array averaged down to
+about PREVIEW values, e.g. 256 points of a 1D sweep or 16x16 of a 2D map). They are saved with the run in
+experiment.yaml and the catalogue so runs can be browsed without loading their data.
+
+    >> monty.summary("1D_SET_sweep.7")["R"]
+    {'shape': [101], 'dtype': 'float64', 'min': 1.2e-11, 'max': 3.4e-09, 'mean': 5.6e-10, 'nan': 0, 'preview': [...]}
+
+Complex arrays are summarised by their magnitude.
+
+@author: james
+"""
+
+import numpy as np
+
+
+PREVIEW = 256  # values in a preview
+DIGITS = 4  # significant digits of the saved numbers (experiment.yaml stays small)
+
+_BARS = " ▁▂▃▄▅▆▇█"
+
+
+def _round(value: float) -> float:
+    return float(f"{value:.{DIGITS}g}")
+
+
+def _bins(x: np.ndarray, size: int, axis: int) -> np.ndarray:
+    """Sum x in size (nearly) equal bins along axis."""
+    edges = np.linspace(0, x.shape[axis], size + 1).astype(int)[:-1]
+    return np.add.reduceat(x, edges, axis)
+
+
+def preview(x: np.ndarray, size: int = PREVIEW) -> np.ndarray:
+    """Average x down to about size values in total (split evenly between the axes). NaNs are ignored."""
+    per_axis = max(1, int(size ** (1 / x.ndim)))
+    finite = np.isfinite(x)
+    sums, counts = np.where(finite, x, 0.0), finite.astype(np.int64)
+    for axis in range(x.ndim):
+        if x.shape[axis] > per_axis:
+            sums, counts = _bins(sums, per_axis, axis), _bins(counts, per_axis, axis)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def summarise_array(value) -> dict:
+    """Summary of a single array. Arrays that aren't numeric only get their shape and dtype."""
+    x = np.asarray(value)
+    result = {"shape": list(x.shape), "dtype": str(x.dtype)}
+    if x.dtype.kind not in "biufc" or x.size == 0:
+        return result
+    x = np.abs(x) if x.dtype.kind == "c" else x.astype(np.float64, copy=False)
+    nan = int(np.count_nonzero(np.isnan(x)))
+    if nan < x.size:
+        result.update(min=_round(np.nanmin(x)), max=_round(np.nanmax(x)), mean=_round(np.nanmean(x)))
+    result["nan"] = nan
+    result["preview"] = np.vectorize(_round, otypes=[float])(preview(x)).tolist() if x.ndim else _round(x)
+    return result
+
+
+def summarise(data: dict) -> dict:
+    """Summaries of every array (and list of numbers) in data."""
+    summaries = {}
+    for key, value in data.items():
+        if isinstance(value, (list, tuple)):
+            try:
+                value = np.asarray(value, dtype=np.float64)
+            except (TypeError, ValueError):  # not a list of numbers
+                continue
+        if hasattr(value, "shape") and hasattr(value, "dtype"):  # numpy, memory mapped and lazy arrays
+            summaries[str(key)] = summarise_array(value)
+    return summaries
+
+
+def sparkline(values, width: int = 24) -> str:
+    """Text plot of a 1D preview (2D previews are averaged over the first axis)."""
+    x = np.asarray(values, dtype=np.float64)
+    if x.ndim > 1:
+        x = x.reshape(-1, x.shape[-1])
+        finite = np.isfinite(x)
+        counts = finite.sum(axis=0)
+        x = np.where(counts > 0, np.where(finite, x, 0.0).sum(axis=0) / np.maximum(counts, 1), np.nan)
+    if x.ndim != 1 or x.size == 0 or not np.isfinite(x).any():
+        return ""
+    if x.size > width:
+        x = preview(x, width)
+    low, high = np.nanmin(x), np.nanmax(x)
+    scale = (len(_BARS) - 2) / (high - low) if high > low else 0
+    return "".join(" " if not np.isfinite(v) else _BARS[1 + int((v - low) * scale)] for v in x)
+
+
+def describe(summaries: dict) -> str:
+    """One line per array of a run."""
+    lines = []
+    for key, s in summaries.items():
+        line = f"{key} {s['dtype']}{tuple(s['shape'])}"
+        if "min" in s:
+            line += f" {s['min']:.3g}..{s['max']:.3g} mean {s['mean']:.3g}"
+        if s.get("nan"):
+            line += f" ({s['nan']} NaN)"
+        if isinstance(s.get("preview"), list):
+            line += " " + sparkline(s["preview"])
+        lines.append(line)
+    return "\n".join(lines)
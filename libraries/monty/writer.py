@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:00 2026
+
+Background writer so that Monty can compress and save data without blocking the measurement.
+
+Jobs are run in order on a single thread. The queue is bounded so a measurement that produces data faster
+than it can be written will eventually wait instead of using up all the memory. Errors raised by a job are
+re-raised by the next check(), submit() or flush().
+
+@author: james
+"""
+
+import atexit
+import functools
+import queue
+import threading
+
+
+class BackgroundWriter:
+    """Run save jobs in order on a background thread."""
+
+    def __init__(self, maxsize: int = 2):
+        """maxsize= number of jobs that can be waiting before submit() blocks."""
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="monty-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)  # don't lose queued saves when the interpreter exits
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                job()
+            except BaseException as err:
+                self._error = err
+            finally:
+                self._queue.task_done()
+
+    def check(self):
+        """Re-raise an error from a previous job."""
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise OSError(f"ERROR: Background save failed: {err!r}") from err
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs). Blocks if the queue is full. The job is queued even if an earlier one failed."""
+        if not self._thread.is_alive():
+            raise OSError("ERROR: Background writer has been closed")
+        self._queue.put(functools.partial(func, *args, **kwargs))
+        self.check()
+
+    def flush(self):
+        """Wait until every queued job has finished."""
+        self._queue.join()
+        self.check()
+
+    def close(self):
+        """Finish all jobs and stop the thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self.check()
@@ -20,6 +20,7 @@ import time
 import matplotlib.pyplot as plt
 
 from feedback import waitforfeedback, feedback  # for legacy imports
+from lockin import QUANTITIES, Snap, poll, BufferCapture, align, derive
 
 # Based upon may.stability_diagram.py
 
@@ -57,47 +58,288 @@ def plotsweep2d(X1: np.ndarray, X2: np.ndarray, Y: np.ndarray,
         print("WARNING: Plotting but no monty object specified. Some things may break")
     
 
+def readout(lockin: SR860, batched: bool = True):
+    """Function returning (X, Y, R, P) of the lockin. batched= one SNAP query (see lockin.py) instead of four"""
+    if batched:
+        return Snap(lockin)
+    return lambda: poll(lockin)
+
+
+def captureline(capture: BufferCapture, gate: Gate, values: np.ndarray, delay_time: float, pbar=None) -> tuple:
+    """
+    Step the gate through values while the lockin records into its buffer, then average the samples taken at
+    each setpoint (skipping capture.settle seconds after each step). Returns (X, Y, R, P) arrays.
+    """
+    starts = np.zeros(len(values))
+    capture.start(duration=len(values) * delay_time + 1.0)
+    try:
+        for (j, v) in enumerate(values):
+            gate(v)
+            starts[j] = time.perf_counter()
+            time.sleep(delay_time)
+            if pbar is not None:
+                pbar.update(1)
+        end = time.perf_counter()
+    finally:
+        t, x, y = capture.stop()
+    ends = np.append(starts[1:], end)
+    X = align(t, x, starts + capture.settle, ends)
+    Y = align(t, y, starts + capture.settle, ends)
+    R, P = derive(X, Y)
+    return X, Y, R, P
+
+
+def _hardware(gate: Gate):
+    """The MDAC channel behind a gate, which ramps and generates waveforms itself."""
+    source = getattr(gate, "source", gate)
+    if not hasattr(source, "ramp") or not hasattr(source, "awg_sawtooth"):
+        raise ValueError(f"ERROR: {gate} is not an MDAC channel so it can't ramp in hardware")
+    return source
+
+
+def rampline(capture: BufferCapture, gate: Gate, low: float, high: float, points: int, sweep_time: float,
+             lag: float = 0.0) -> tuple:
+    """
+    Sweep the gate from low to high with a single hardware ramp of the MDAC while the lockin records into its
+    buffer. The samples are binned to np.linspace(low, high, points) by the time since the ramp started.
+
+    sweep_time= seconds the ramp takes
+    lag= seconds the lockin output lags the gate (about the lockin time constant)
+
+    Returns (X, Y, R, P) arrays.
+    """
+    source = _hardware(gate)
+    gate(low)
+    time.sleep(max(lag, 0.1))
+    capture.start(duration=sweep_time + lag + 1.0)
+    try:
+        t_start = time.perf_counter()
+        source.ramp(high, abs(high - low) / sweep_time)
+        source.block()
+        time.sleep(lag)  # let the lockin catch up with the end of the ramp
+    finally:
+        t, x, y = capture.stop()
+        gate.get()  # update the cached voltage after the hardware ramp
+    dt = sweep_time / max(1, points - 1)
+    centres = t_start + lag + np.arange(points) * dt
+    starts = np.maximum(centres - dt / 2, t_start + lag)
+    ends = np.minimum(centres + dt / 2, t_start + lag + sweep_time)
+    X = align(t, x, starts, ends)
+    Y = align(t, y, starts, ends)
+    R, P = derive(X, Y)
+    return X, Y, R, P
+
+
+def sawtoothline(capture: BufferCapture, gate: Gate, low: float, high: float, points: int, sweep_time: float,
+                 periods: int = 4, oversample: int = 8, lag: float = 0.0) -> tuple:
+    """
+    Sweep the gate with a continuous MDAC sawtooth and average several periods. The lockin is clocked by the MDAC
+    trigger of the capture, which runs in sync with the sawtooth, so every sample's voltage is known from its index
+    alone. Samples are binned to np.linspace(low, high, points) (the sawtooth overshoots by half a bin each side).
+
+    sweep_time= period of the sawtooth in seconds
+    periods= number of periods to average
+    oversample= samples per bin in every period
+    lag= seconds the lockin output lags the gate. The first bins after the fly back are the least accurate
+
+    Returns (X, Y, R, P) arrays.
+    """
+    if capture.trigger is None:
+        raise ValueError("ERROR: Sawtooth sweeps need a capture clocked by an MDAC trigger")
+    source = _hardware(gate)
+    step = (high - low) / max(1, points - 1)
+    per_period = points * oversample
+    rate = per_period / sweep_time
+    source.awg_sawtooth(1 / sweep_time, step * points, (low + high) / 2)
+    original, capture.rate = capture.rate, rate  # only for this line. The capture may be reused for other sweeps
+    try:
+        capture.start(duration=periods * sweep_time + 1.0)  # starting the trigger resyncs it with the sawtooth
+        time.sleep(periods * sweep_time + lag)
+    finally:
+        t, x, y = capture.stop()
+        capture.rate = original
+        source.awg_off()
+        gate.get()
+        gate(low)
+    shift = int(round(lag * rate))  # sample i + shift shows the voltage of sample i
+    whole = max(1, (len(x) - shift) // per_period) * per_period  # whole periods only, so every bin is weighted equally
+    x, y = x[shift:shift + whole], y[shift:shift + whole]
+    bins = (np.arange(len(x)) % per_period) // oversample
+    counts = np.bincount(bins, minlength=points)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        X = np.where(counts > 0, np.bincount(bins, x, points) / np.maximum(counts, 1), np.nan)
+        Y = np.where(counts > 0, np.bincount(bins, y, points) / np.maximum(counts, 1), np.nan)
+    R, P = derive(X, Y)
+    return X, Y, R, P
+
+
+class Axis:
+    """One axis of a sweep: a gate (or a list of gates set together) stepped through values."""
+
+    def __init__(self, gates: Gate | list[Gate], values, delay_time: float = 0.1, name: str = None):
+        """
+        values= setpoints in the order they are measured
+        delay_time= wait after every step of this axis
+        name= label of the axis. Defaults to the gate name ("Paired gates" for a list)
+        """
+        self.gates = list(gates) if isinstance(gates, (list, tuple)) else [gates]
+        self.values = np.asarray(values)
+        self.delay_time = delay_time
+        self.name = name or ("Paired gates" if len(self.gates) > 1 else self.gates[0].name)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __repr__(self) -> str:
+        return f"{self.name} from {self.values[0]}V to {self.values[-1]}V in {len(self)} points"
+
+    def set(self, value: float):
+        for gate in self.gates:
+            gate(value)
+
+
+def sweep(axes: list[Axis], readouts: dict, on_point=None, on_line=None, line=None, settle: float = 2.0,
+          snake: bool = False, offset: float = 0.0) -> dict:
+    """
+    Sweep any number of axes (the last one is the fastest) and read every readout at every point. The outer axes
+    are only set when their value changes and the results are allocated once before the sweep.
+
+    readouts= {name: function} or {(name1, name2, ...): function returning a tuple}, e.g. {QUANTITIES: read}
+    on_point(index, results)= called after each point is read (feedback, live plots)
+    on_line(index, results)= called after each line of the last axis with the index of the outer axes (saving)
+    line(axis, pbar)= measure a whole line of the last axis at once instead of stepping it (e.g. captureline).
+                      Returns a tuple of arrays in the order of the readout names. The readout functions are not
+                      called then and can be None
+    settle= wait after moving to the start for the lockin to catch up
+    snake= sweep every second line of the last axis backwards instead of slewing back to its start. Points are
+           stored by setpoint index so the results are in the same order as without it
+    offset= added to the setpoints of the backward lines to correct hysteresis (see calibrate_hysteresis)
+
+    Returns {name: array} with one dimension per axis.
+    """
+    if not axes:
+        raise ValueError("ERROR: A sweep needs at least one axis")
+    shape = tuple(len(axis) for axis in axes)
+    groups = [(key,) if isinstance(key, str) else tuple(key) for key in readouts]
+    results = {name: np.zeros(shape) for group in groups for name in group}
+    reads = [([results[name] for name in group], function, len(group) == 1)
+             for group, function in zip(groups, readouts.values())]
+    outputs = [results[name] for group in groups for name in group]
+    *outer, fast = axes
+    forward = list(enumerate(fast.values))
+    backward = [(i, fast.values[i] + offset) for i in reversed(range(len(fast)))]
+    fast_backward = Axis(fast.gates, fast.values[::-1] + offset, fast.delay_time, fast.name)
+
+    # Move to the start and wait for the lockin to catchup
+    for axis in axes:
+        axis.set(axis.values[0])
+    time.sleep(settle)
+
+    current = [None] * len(outer)
+    with tqdm(total=int(np.prod(shape))) as pbar:
+        for (n, index) in enumerate(np.ndindex(*shape[:-1])):
+            backwards = snake and n % 2 == 1
+            delay = None
+            for (k, i) in enumerate(index):
+                if current[k] != i:
+                    outer[k].set(outer[k].values[i])
+                    current[k] = i
+                    delay = max(delay or 0.0, outer[k].delay_time)
+            if delay is not None:
+                time.sleep(delay)
+
+            if line is not None:
+                for (arr, values) in zip(outputs, line(fast_backward if backwards else fast, pbar)):
+                    arr[index] = values[::-1] if backwards else values
+            else:
+                for (i, value) in (backward if backwards else forward):
+                    fast.set(value)
+                    time.sleep(fast.delay_time)
+                    point = index + (i,)
+                    for (arrs, function, single) in reads:
+                        if single:
+                            arrs[0][point] = function()
+                        else:
+                            for (arr, v) in zip(arrs, function()):
+                                arr[point] = v
+                    if on_point is not None:
+                        on_point(point, results)
+                    pbar.update(1)
+
+            if on_line is not None:
+                on_line(index, results)
+    return results
+
+
+def hysteresis_shift(values: np.ndarray, up: np.ndarray, down: np.ndarray) -> float:
+    """
+    Voltage shift of the backward sweep "down" relative to the forward sweep "up" (both in the order of values),
+    from the peak of their cross correlation (interpolated between steps). A feature at V going up is at V + shift
+    going down. Shifts of up to a quarter of the range are found.
+    """
+    u = np.nan_to_num(up - np.nanmean(up))
+    d = np.nan_to_num(down - np.nanmean(down))
+    n = len(values)
+    lags = np.arange(-max(1, n // 4), max(1, n // 4) + 1)
+    corr = np.array([np.dot(u[max(0, -k):n - max(0, k)], d[max(0, k):n - max(0, -k)]) / (n - abs(k))
+                     for k in lags])
+    j = int(np.argmax(corr))
+    delta = 0.0
+    if 0 < j < len(corr) - 1:
+        curvature = corr[j - 1] - 2 * corr[j] + corr[j + 1]
+        if curvature < 0:
+            delta = 0.5 * (corr[j - 1] - corr[j + 1]) / curvature
+    return float((lags[j] + delta) * (values[1] - values[0]))
+
+
+def calibrate_hysteresis(lockin: SR860, gate: Gate, low: float, high: float, points: int, delay_time=0.1,
+                         batched=True, quantity="R") -> float:
+    """
+    Sweep the gate up and back down and return the hysteresis offset for snake sweeps (sweep2d(hysteresis=...)).
+    Pick a range with a clear feature (e.g. a few Coulomb peaks) and the same delay_time as the map.
+
+    quantity= which of X, Y, R or P is compared
+    """
+    values = np.linspace(low, high, points)
+    direction = Axis([], [0, 1], 0.0, "direction")
+    result = sweep([direction, Axis(gate, values, delay_time)], {QUANTITIES: readout(lockin, batched)}, snake=True)
+    shift = hysteresis_shift(values, result[quantity][0], result[quantity][1])
+    print(f"Hysteresis of {gate}: features are shifted by {shift:.3g}V sweeping down")
+    return shift
+
+
 def sweep1d(lockin: SR860,
             gate: Gate, low: float, high: float, points: int,
-            delay_time=0.1, plot=True, monty=None) -> dict:
+            delay_time=0.1, plot=True, monty=None, batched=True, capture: BufferCapture = None) -> dict:
     """
     Perform a 1D sweep of the specified gate.
     
     plot= if we should plot additionally
     monty= the Monty datasaver object (needed if plotting)
+    batched= read X, Y, R and P in one lockin query
+    capture= record the lockin into its buffer during the sweep instead of reading it at every point (see
+             lockin.BufferCapture). Each point is the average over its delay_time
     """
     print(f"Sweeping {gate} from {low}V to {high}V in {points} points.")
     gate_range = np.linspace(low, high, points)
-    X = np.zeros((points))
-    Y = np.zeros((points))
-    R = np.zeros((points))
-    P = np.zeros((points))
-    
-    # Move to the start and wait a second for the lockin to catchup
-    gate(gate_range[0])
-    time.sleep(2.0)
-
-    with tqdm(total=points) as pbar, LivePlot(gate_range, xlabel=f"{gate.name} gate voltage (V)", ylabel="Current (A)") as lplot:
-        for (j, g) in enumerate(gate_range):
-            gate(g)
-            #print(f"Set = {g}")
-            time.sleep(delay_time)
-            X[j] = lockin.X()
-            Y[j] = lockin.Y()
-            R[j] = lockin.R()
-            P[j] = lockin.P()
-            pbar.update(1)
-            lplot.update(R)
+    line = None
+    if capture is not None:
+        line = lambda axis, pbar: captureline(capture, gate, axis.values, delay_time, pbar)
+
+    with LivePlot(gate_range, xlabel=f"{gate.name} gate voltage (V)", ylabel="Current (A)") as lplot:
+        result = sweep([Axis(gate, gate_range, delay_time)], {QUANTITIES: readout(lockin, batched)},
+                       on_point=lambda index, results: lplot.update(results["R"]),
+                       on_line=lambda index, results: lplot.update(results["R"]), line=line)
 
     if plot:
-        plotsweep1d(gate_range, R, gate.name, monty)
-    return {"X": X, "Y": Y, "R": R, "P": P}
+        plotsweep1d(gate_range, result["R"], gate.name, monty)
+    return result
 
 
 def sweep1dfeedback(lockin: SR860,
             gate: Gate, low: float, high: float, points: int,
             fbgate: Gate, target: float, tol=1e-11,
-            delay_time=0.1, plot=True, monty=None) -> dict:
+            delay_time=0.1, plot=True, monty=None, batched=True) -> dict:
     """
     Perform a 1D sweep of the specified gate with feedback (PID)
     
@@ -106,50 +348,37 @@ def sweep1dfeedback(lockin: SR860,
     
     calibration=float is the lockin current expected (will shift due to the sweep)
     tol=0.1 range we move to get within before measuring another point
-    
+    batched= read X, Y, R and P in one lockin query
     """
     print("WARNING THIS IS A LEGACY METHOD AND NOT UP TO DATE")
     print(f"Sweeping {gate} from {low}V to {high}V in {points} points.")
     gate_range = np.linspace(low, high, points)
-    X = np.zeros((points))
-    Y = np.zeros((points))
-    R = np.zeros((points))
-    P = np.zeros((points))
-    
-    # Move to the start and wait a second for the lockin to catchup
-    gate(gate_range[0])
-    time.sleep(2.0)
-    
-    with tqdm(total=points) as pbar:
-        for (j, g) in enumerate(gate_range):
-            gate(g)
-            #print(f"Set = {g}")
-            time.sleep(delay_time)
-            X[j] = lockin.X()
-            Y[j] = lockin.Y()
-            R[j] = lockin.R()
-            P[j] = lockin.P()
-            
-            waitforfeedback(fbgate, lockin, target, tol)
-            
-            pbar.update(1)
+    result = sweep([Axis(gate, gate_range, delay_time)], {QUANTITIES: readout(lockin, batched)},
+                   on_point=lambda index, results: waitforfeedback(fbgate, lockin, target, tol))
     
     if plot:
-        plotsweep1d(gate_range, R, gate.name, monty)
-    return {"X": X, "Y": Y, "R": R, "P": P}
+        plotsweep1d(gate_range, result["R"], gate.name, monty)
+    return result
 
 
 def sweep2d(lockin: SR860,
             gate1: Gate | list[Gate], low1: float, high1: float, points1: int,
             gate2: Gate, low2: float, high2: float, points2: int,
-            callback=None, delay_time=0.1, plot=True, monty=None, alternate_directions=False):
+            callback=None, delay_time=0.1, plot=True, monty=None, alternate_directions=False, batched=True,
+            capture: BufferCapture = None, hysteresis: float = 0.0):
     """
     Perform a 2D sweep between the specified gates.
     
     callback({X,Y,R,P}) is called optionally at the end of one line sweep
     plot= if we should plot additionally
     monty= the Monty datasaver object (needed if plotting)
-    alternate_directions=False if the sweep should alternate in a snake like map over the voltages (unimplemneted)
+    alternate_directions=False if the sweep should alternate in a snake like map over the voltages (no slew back to
+                         low2 after each line). The lines are stored in the same order either way
+    hysteresis= offset added to gate2 on the lines swept down (see calibrate_hysteresis). Only with
+                alternate_directions
+    batched= read X, Y, R and P in one lockin query
+    capture= record the lockin into its buffer during each line of gate2 and download it at the end of the line
+             instead of reading it at every point (see lockin.BufferCapture)
     
     gate1 can optionly be a group of gates to move at once. If so give these as a list
     """
@@ -159,61 +388,84 @@ def sweep2d(lockin: SR860,
         print(f"Sweeping {gate1} from {low1}V to {high1}V in {points1} points,")
     print(f"Sweeping {gate2} from {low2}V to {high2}V in {points2} points")
     if alternate_directions:
-        print("WARNING THIS IS FAILING: Alternating directions after each 1D sweep (zig zag pathing)")
-    G1_range = np.linspace(low1, high1, points1)
-    G2_range = np.linspace(low2, high2, points2)
-    X = np.zeros((points1, points2))
-    Y = np.zeros((points1, points2))
-    R = np.zeros((points1, points2))
-    P = np.zeros((points1, points2))
+        print(f"Alternating directions after each 1D sweep (zig zag pathing), offset by {hysteresis}V going down")
+    axis1 = Axis(gate1, np.linspace(low1, high1, points1), delay_time)
+    axis2 = Axis(gate2, np.linspace(low2, high2, points2), delay_time)
+    line = None
+    if capture is not None:
+        line = lambda axis, pbar: captureline(capture, gate2, axis.values, delay_time, pbar)
+    on_line = None
+    if callback is not None:  # Save each sweep
+        on_line = lambda index, results: callback(results)
+
+    result = sweep([axis1, axis2], {QUANTITIES: readout(lockin, batched)}, on_line=on_line, line=line,
+                   snake=alternate_directions, offset=hysteresis if alternate_directions else 0.0)
     
-    # Move to the start and wait a second for the lockin to catchup
-    if isinstance(gate1, list):
-        for gate in gate1:
-            gate(G1_range[0])
+    if plot:
+        plotsweep2d(axis1.values, axis2.values, result["R"], axis1.name, gate2.name, monty)
+    return result
+
+
+def sweep1dramp(lockin: SR860, gate: Gate, low: float, high: float, points: int, capture: BufferCapture,
+                sweep_time: float, mode="ramp", periods: int = 4, lag: float = 0.0, plot=True, monty=None) -> dict:
+    """
+    Perform a 1D sweep of the specified gate with the MDAC ramping the gate in hardware while the lockin records
+    into its buffer, instead of setting and reading every point.
+
+    capture= lockin.BufferCapture to record with (clocked by an MDAC trigger for mode="sawtooth")
+    sweep_time= seconds the sweep takes
+    mode= "ramp" (one hardware ramp, see rampline) or "sawtooth" (average periods of a sawtooth, see sawtoothline)
+    lag= seconds the lockin output lags the gate (about the lockin time constant)
+    plot= if we should plot additionally
+    monty= the Monty datasaver object (needed if plotting)
+    """
+    print(f"Ramping {gate} from {low}V to {high}V in {sweep_time}s, binned to {points} points.")
+    gate_range = np.linspace(low, high, points)
+    if mode == "ramp":
+        X, Y, R, P = rampline(capture, gate, low, high, points, sweep_time, lag)
+    elif mode == "sawtooth":
+        X, Y, R, P = sawtoothline(capture, gate, low, high, points, sweep_time, periods, lag=lag)
     else:
-        gate1(G1_range[0])
-    gate2(G2_range[0])
-    time.sleep(2.0)
-    
-    with tqdm(total=points1*points2) as pbar:
-        for (j, g1) in enumerate(G1_range):
-            if isinstance(gate1, list):
-                for gate in gate1:
-                    gate(g1)
-            else:
-                gate1(g1)
-            time.sleep(delay_time)
-            
-            for (i, g2) in enumerate(G2_range):
-                gate2(g2)
-                time.sleep(delay_time)
-                
-                X[j, i] = lockin.X()
-                Y[j, i] = lockin.Y()
-                R[j, i] = lockin.R()
-                P[j, i] = lockin.P()
-                
-                pbar.update(1)
-            
-            if alternate_directions:  # sweep in a zig-zag path
-                G2_range = G2_range[::-1]  # some how this doesn't work???? 
-                time.sleep(0.1)
-                
-            # Save each sweep
-            if callback is not None:
-                callback({"X": X, "Y": Y, "R": R, "P": P})
-            
-    # TODO: Fails due to hysteresis
-    if alternate_directions:  # fix saving as every second line is the wrong direction
-        X[1::2, :] = X[1::2, ::-1]  # grab every second row and flip it
-        Y[1::2, :] = Y[1::2, ::-1]
-        R[1::2, :] = R[1::2, ::-1]
-        P[1::2, :] = P[1::2, ::-1]
-    
+        raise ValueError(f"ERROR: Unknown mode '{mode}'. Must be 'ramp' or 'sawtooth'")
     if plot:
-        plotsweep2d(G1_range, G2_range, R, "Paired gates" if isinstance(gate1, list) else gate1.name, gate2.name, monty)
+        plotsweep1d(gate_range, R, gate.name, monty)
     return {"X": X, "Y": Y, "R": R, "P": P}
-                
-                
-    
+
+
+def sweep2dramp(lockin: SR860,
+                gate1: Gate | list[Gate], low1: float, high1: float, points1: int,
+                gate2: Gate, low2: float, high2: float, points2: int,
+                capture: BufferCapture, sweep_time: float, mode="ramp", periods: int = 4, lag: float = 0.0,
+                callback=None, delay_time=0.1, plot=True, monty=None):
+    """
+    Perform a 2D sweep where every line of gate2 is a hardware ramp (or sawtooth) of the MDAC recorded into the
+    lockin buffer (see sweep1dramp). gate1 is stepped as in sweep2d.
+
+    callback({X,Y,R,P}) is called optionally at the end of one line sweep
+    delay_time= wait after stepping gate1
+    """
+    if mode not in ("ramp", "sawtooth"):
+        raise ValueError(f"ERROR: Unknown mode '{mode}'. Must be 'ramp' or 'sawtooth'")
+    gates1 = gate1 if isinstance(gate1, list) else [gate1]
+    print(f"Sweeping {[g.name for g in gates1]} from {low1}V to {high1}V in {points1} points,")
+    print(f"Ramping {gate2} from {low2}V to {high2}V in {sweep_time}s per line, binned to {points2} points")
+    axis1 = Axis(gate1, np.linspace(low1, high1, points1), delay_time)
+    axis2 = Axis(gate2, np.linspace(low2, high2, points2))
+
+    def line(axis, pbar):
+        if mode == "ramp":
+            values = rampline(capture, gate2, low2, high2, points2, sweep_time, lag)
+        else:
+            values = sawtoothline(capture, gate2, low2, high2, points2, sweep_time, periods, lag=lag)
+        pbar.update(points2)
+        return values
+
+    on_line = None
+    if callback is not None:  # Save each sweep
+        on_line = lambda index, results: callback(results)
+
+    result = sweep([axis1, axis2], {QUANTITIES: None}, on_line=on_line, line=line, settle=delay_time)
+
+    if plot:
+        plotsweep2d(axis1.values, axis2.values, result["R"], axis1.name, gate2.name, monty)
+    return result
@@ -7,7 +7,7 @@ Functions to plot the plots used in my thesis.
 @author: james
 """
 
-from monty import Monty, loadraw
+from monty import Monty, loadraw, cache
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import matplotlib.pylab as pylab
@@ -15,6 +15,7 @@ import numpy as np
 import os
 import pandas as pd
 
+cache.enable()  # the same runs are loaded by several plots (and every time the script is run)
 
 default_ftype = ".pdf"
 default_color = "orange"